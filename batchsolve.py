@@ -0,0 +1,165 @@
+#!/bin/python3
+import argparse
+import contextlib
+import glob
+import io
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import resource
+import time
+from solver import Solver
+from solutioncache import SolutionCache
+from memory import parse_size
+
+
+def solvelevel(filename: str, options: dict, memorylimit: int, conn) -> None:
+    """Solve one level (in a worker process) and send its report entry to conn."""
+    if memorylimit:
+        resource.setrlimit(resource.RLIMIT_AS, (memorylimit, memorylimit))
+    entry = {'map': filename}
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):  # progress output
+            entry.update(Solver(filename, **options).solve().todict())
+    except MemoryError:
+        entry.update(status='memory limit')
+    except SystemExit:  # invalid map, see IntMap.setup()
+        lines = output.getvalue().splitlines()
+        entry.update(status='error', reason=lines[-1] if lines else None)
+    conn.send(entry)
+
+
+class BatchSolve:
+    def __init__(self):
+        self.parse_args()
+
+    def main(self):
+        levels = self.find_levels()
+        if not levels:
+            print("ERROR: no levels found")
+            exit(10)
+        # longest processing time first: slowest known levels (unknown ones before them) start first
+        history = self.read_history()
+        levels.sort(key=lambda filename: -history.get(filename, float('inf')))
+        options = {'treesize': self.args.tree_size, 'forgetfulsize': self.args.forgetful_size,
+                   'keymode': "exact" if self.args.exact_keys else "zobrist", 'engine': self.args.engine,
+                   'algorithm': self.args.algorithm, 'mapcache': self.args.map_cache}
+        if self.args.solution_cache:
+            options['solutioncache'] = SolutionCache(self.args.solution_cache, self.args.solution_cache_size)
+
+        running = {}  # type: dict  # connection: (filename, process, start time)
+        with open(self.args.report, 'w') as report:
+            while levels or running:
+                while levels and len(running) < self.args.jobs:
+                    filename = levels.pop(0)
+                    conn, childconn = multiprocessing.Pipe(duplex=False)
+                    process = multiprocessing.Process(target=solvelevel, daemon=True,
+                                                      args=(filename, options, self.args.memory_limit, childconn))
+                    process.start()
+                    childconn.close()
+                    running[conn] = (filename, process, time.perf_counter())
+
+                wait = 1.0
+                if self.args.timeout:
+                    deadline = min(start for _, _, start in running.values()) + self.args.timeout
+                    wait = max(0.0, min(wait, deadline - time.perf_counter()))
+                for conn in multiprocessing.connection.wait(list(running), timeout=wait):
+                    filename, process, start = running.pop(conn)
+                    try:
+                        entry = conn.recv()
+                    except EOFError:  # killed, e.g. by the operating system when out of memory
+                        entry = {'map': filename, 'status': 'crashed'}
+                    process.join()
+                    entry.setdefault('time', round(time.perf_counter() - start, 3))
+                    self.report(report, entry)
+                for conn, (filename, process, start) in list(running.items()):
+                    if self.args.timeout and time.perf_counter() - start > self.args.timeout:
+                        process.kill()
+                        process.join()
+                        del running[conn]
+                        self.report(report, {'map': filename, 'status': 'timeout', 'time': self.args.timeout})
+
+    def report(self, report, entry: dict) -> None:
+        """Write an entry to the report (one JSON object per line) and print a summary."""
+        report.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        report.flush()
+        steps = f" in {entry['steps']} steps" if entry.get('steps') is not None else ""
+        reason = f": {entry['reason']}" if entry.get('reason') else ""
+        print(f"{entry['map']}: {entry['status']}{steps}{reason} ({entry.get('time', 0):.1f} s)")
+
+    def find_levels(self) -> list[str]:
+        """All map files in the given directories and glob patterns."""
+        levels = []
+        for pattern in self.args.levels:
+            patterns = [pattern]
+            if os.path.isdir(pattern):
+                patterns = [os.path.join(pattern, "*.txt"), os.path.join(pattern, "*.lvl")]
+            for filename in sorted(filename for pattern in patterns for filename in glob.glob(pattern)):
+                if filename not in levels:
+                    levels.append(filename)
+        return levels
+
+    def read_history(self) -> dict:
+        """Solving times of the last run from an existing report."""
+        history = {}
+        if not os.path.exists(self.args.report):
+            return history
+        with open(self.args.report) as report:
+            for line in report:
+                try:
+                    entry = json.loads(line)
+                    history[entry['map']] = float(entry['time'])
+                except (ValueError, KeyError, TypeError):
+                    continue
+        return history
+
+    def parse_args(self):
+        argparser = argparse.ArgumentParser(
+            prog="batchsolve.py",
+            description="""Solve many levels in parallel and write a report with one JSON object per level.
+            Levels which were slowest in the last run (of the same report) are started first.
+            """
+        )
+        argparser.add_argument("levels", nargs="+", metavar="LEVEL",
+                               help="Map file, directory of map files (*.txt and *.lvl) or glob pattern.")
+        argparser.add_argument("-o", "--report", type=str, metavar="FILE", default="report.jsonl",
+                               help="Report file (JSON lines).")
+        argparser.add_argument("-j", "--jobs", type=int, metavar="N", default=os.cpu_count(),
+                               help="Number of levels to solve at once.")
+        argparser.add_argument("--timeout", type=float, metavar="SECONDS",
+                               help="Stop solving a level after SECONDS.")
+        argparser.add_argument("--memory-limit", type=self.size, metavar="SIZE",
+                               help="Maximum address space per level (like 512M or 4G).")
+        argparser.add_argument("-t", "--tree-size", type=int, metavar="INT", default=15,
+                               help="Maximum number of tree levels to memorize before forgetful iteration.")
+        argparser.add_argument("-f", "--forgetful-size", type=int, metavar="INT", default=5,
+                               help="Number of steps to simulate in forgetful iteration.")
+        argparser.add_argument("-x", "--exact-keys", action="store_true",
+                               help="Store whole tile constellations instead of 64-bit fingerprints.")
+        argparser.add_argument("-e", "--engine", choices=Solver.ENGINES, default="python",
+                               help="Engine for building the tree.")
+        argparser.add_argument("-a", "--algorithm", choices=Solver.ALGORITHMS, default="bfs",
+                               help="Search algorithm.")
+        argparser.add_argument("--map-cache", type=str, metavar="DIR",
+                               help="Store compiled maps in DIR and load them from there next time.")
+        argparser.add_argument("--solution-cache", type=str, metavar="DIR",
+                               help="Store results in DIR and use them when the same map is solved again.")
+        argparser.add_argument("--solution-cache-size", type=self.size, metavar="SIZE", default=2**26,
+                               help="Remove least recently used results when the solution cache exceeds SIZE.")
+
+        self.args = argparser.parse_args()
+
+    @staticmethod
+    def size(text):
+        try:
+            return parse_size(text)
+        except ValueError as error:
+            raise argparse.ArgumentTypeError(str(error))
+
+
+# ========== ENTRY POINT ==========
+if __name__ == "__main__":
+    BatchSolve().main()
+# =================================
@@ -0,0 +1,235 @@
+#!/bin/python3
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import numpy as np
+from map import IntMap
+from frontier import VectorMap
+from bitboard import BitMap
+from solver import Solver
+from node import Node
+from batchsolve import solvelevel
+
+MAPDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "map")
+
+
+class Benchmark:
+    """Benchmarks of move generation, duplicate detection, solving and memory.
+
+    Each metric is stored as {"value": float, "unit": str, "better": "higher" or "lower"}.
+    """
+    # small, medium and heavy maps (with destroyers) for move generation and duplicate detection
+    MAPS = ["world_1/level_5_small.txt", "world_1/level_7.txt", "world_2/level_10.txt"]
+    # maps and solver options of end-to-end solves, each in its own process (for peak memory)
+    SOLVES = [
+        ("world_1/level_2.txt", {'treesize': 20, 'forgetfulsize': 0}),
+        ("world_1/level_4_small.txt", {'treesize': 20, 'forgetfulsize': 0}),
+        ("world_1/level_4_small.txt", {'treesize': 20, 'forgetfulsize': 0, 'engine': 'bitboard'}),
+        ("world_1/level_7.txt", {'treesize': 20, 'forgetfulsize': 0, 'engine': 'numpy'}),
+        ("world_1/level_6_small.txt", {'treesize': 4, 'forgetfulsize': 9}),
+        ("world_2/level_10.txt", {'treesize': 11, 'forgetfulsize': 0}),
+    ]
+    NSTATES = 20000  # number of sampled states per map
+    SIZES = [8, 16, 32, 64]  # path lengths for synthetic maps
+    REPEATS = 3  # best of
+
+    def __init__(self):
+        self.results = {}  # type: dict  # name: metric
+
+    def add(self, name: str, value: float, unit: str, better: str) -> None:
+        self.results[name] = {'value': value, 'unit': unit, 'better': better}
+        print(f"  {name:40s} {value:14.2f} {unit}")
+
+    def run(self) -> dict:
+        print("Move generation and duplicate detection:")
+        for mapname in self.MAPS:
+            self.movegen(mapname)
+        print("Solving:")
+        for mapname, options in self.SOLVES:
+            self.solve(mapname, options)
+        print("Complexity on open maps:")
+        self.complexity("corridor", 1)
+        self.complexity("open", 2)
+        return self.results
+
+    @classmethod
+    def best(cls, function) -> float:
+        """Shortest time of some calls of function."""
+        times = []
+        for _ in range(cls.REPEATS):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    def sample(self, mp: IntMap) -> list[tuple]:
+        """Sample (tiles, key) of NSTATES constellations with random walks from the start (reproducible)."""
+        rng = random.Random(0)
+        states = []
+        while len(states) < self.NSTATES:
+            tiles = mp.start
+            for _ in range(30):
+                newtiles = mp.move(tiles, rng.randrange(4))
+                if mp.node_has_no_future(newtiles):
+                    break
+                tiles = newtiles
+                states.append((tiles, mp.key(tiles)))
+        return states[:self.NSTATES]
+
+    def movegen(self, mapname: str) -> None:
+        name = os.path.splitext(mapname)[0]
+        with contextlib.redirect_stdout(io.StringIO()):
+            mp = IntMap(os.path.join(MAPDIR, mapname))
+        states = self.sample(mp)
+        children = [move for tiles, key in states for move in mp.keyed_moves(tiles, key)]
+
+        def moves():
+            for tiles, key in states:
+                mp.keyed_moves(tiles, key)
+        self.add(f"movegen/{name}", len(states) / self.best(moves), "states/s", "higher")
+
+        def dedup():
+            seen = set()
+            for _, key in children:
+                if key not in seen:
+                    seen.add(key)
+        self.add(f"dedup/{name}", len(children) / self.best(dedup), "keys/s", "higher")
+
+        bmap = BitMap(mp)
+        boards = [bmap.board(tiles) for tiles, _ in states]
+
+        def bitboardmoves():
+            for board in boards:
+                for newboard in bmap.moves(board):
+                    bmap.key(newboard)
+        self.add(f"movegen-bitboard/{name}", len(states) / self.best(bitboardmoves), "states/s", "higher")
+
+        vmap = VectorMap(mp)
+        rows = vmap.rows([tiles for tiles, _ in states])
+        self.add(f"movegen-numpy/{name}", len(states) / self.best(lambda: vmap.moves(rows)), "states/s", "higher")
+        childrows = vmap.rows([tiles for tiles, _ in children])
+        self.add(f"dedup-numpy/{name}", len(children) / self.best(lambda: np.unique(vmap.canonical_keys(childrows))),
+                 "keys/s", "higher")
+
+    def solve(self, mapname: str, options: dict) -> None:
+        """Solve in a separate process, so its peak memory can be measured."""
+        name = os.path.splitext(mapname)[0] + "".join(f" {key[0]}{value}" for key, value in options.items())
+        conn, childconn = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=solvelevel, args=(os.path.join(MAPDIR, mapname), options, None, childconn))
+        process.start()
+        childconn.close()
+        try:
+            entry = conn.recv()
+        except EOFError:  # killed, see BatchSolve.main()
+            entry = {'status': 'crashed'}
+        process.join()
+        if 'time' not in entry:  # crashed, memory limit or invalid map, see solvelevel()
+            print(f"  {'solve/' + name:40s} {entry['status']:>14s}")
+            return
+        self.add(f"solve/{name}", entry['time'], "s", "lower")
+        self.add(f"memory/{name}", entry['peak_rss'] / 2**20, "MiB", "lower")
+
+    def complexity(self, name: str, dimensions: int) -> None:
+        """Number of constellations and time of breadth-first search with one tile on an open map,
+        which should grow like O(n^dimensions) with the path length n (see README).
+        The growth exponent is the slope of a least squares fit in log-log scale.
+        """
+        counts = []
+        times = []
+        for n in self.SIZES:
+            width = 2*n + 5
+            height = width if dimensions == 2 else 3
+            rows = [['#']*width] + [['#'] + [' ']*(width-2) + ['#'] for _ in range(height-2)] + [['#']*width]
+            rows[height//2][width//2] = 'a'  # tile in the middle
+            rows[1][1] = 'A'  # target more than n steps away
+            with tempfile.NamedTemporaryFile('w', suffix=".txt", delete=False) as file:
+                file.write("\n".join("".join(row) for row in rows))
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    solver = Solver(file.name, treesize=n, forgetfulsize=0, symmetry=False)
+                    start = time.perf_counter()
+                    tree = solver.buildtree(set([Node(solver.map.start, solver.map.key(solver.map.start))]))
+                    times.append(time.perf_counter() - start)
+            finally:
+                os.remove(file.name)
+            counts.append(len(tree.seen))
+        logn = np.log(self.SIZES)
+        self.add(f"complexity/{name} states", float(np.polyfit(logn, np.log(counts), 1)[0]), "exponent", "lower")
+        self.add(f"complexity/{name} time", float(np.polyfit(logn, np.log(times), 1)[0]), "exponent", "lower")
+
+    @staticmethod
+    def compare(baseline: dict, results: dict, threshold: float) -> list[str]:
+        """Print the change of each metric and return the names of metrics which got worse by more than threshold (%)."""
+        regressions = []
+        for name, metric in results.items():
+            if name not in baseline:
+                continue
+            old, new = baseline[name]['value'], metric['value']
+            change = (new - old) / abs(old) * 100 if old else 0.0
+            worse = change < -threshold if metric['better'] == "higher" else change > threshold
+            if metric['unit'] == "exponent":  # compare absolute difference of exponents
+                change = new - old
+                worse = change > threshold / 100 * max(1.0, abs(old))
+            flag = "REGRESSION" if worse else ""
+            print(f"  {name:40s} {old:12.2f} -> {new:12.2f} {metric['unit']:9s} {change:+7.1f}{'' if metric['unit'] == 'exponent' else '%'} {flag}")
+            if worse:
+                regressions.append(name)
+        for name in baseline.keys() - results.keys():  # e.g. solving failed
+            print(f"  {name:40s} {baseline[name]['value']:12.2f} -> {'missing':>12s} {'':9s} {'':8s} REGRESSION")
+            regressions.append(name)
+        return regressions
+
+
+class BenchmarkCommand:
+    def __init__(self):
+        self.parse_args()
+
+    def main(self):
+        if self.args.command == "run":
+            results = Benchmark().run()
+            with open(self.args.output, 'w') as file:
+                json.dump(results, file, indent=1, ensure_ascii=False)
+            print(f"Saved to {self.args.output}.")
+            return
+        files = [self.args.baseline, self.args.results]
+        for filename in files:
+            if not os.path.exists(filename):
+                print(f"ERROR: {filename} not found (create it with: benchmark.py run -o {filename})")
+                exit(10)
+        baseline, results = [json.load(open(filename)) for filename in files]
+        regressions = Benchmark.compare(baseline, results, self.args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {self.args.threshold}%.")
+            exit(1)
+        print(f"No regressions beyond {self.args.threshold}%.")
+
+    def parse_args(self):
+        argparser = argparse.ArgumentParser(
+            prog="benchmark.py",
+            description="""Measure move generation and duplicate detection throughput, solve times, peak memory
+            and the growth of the search on open maps. Compare results with a stored baseline to find regressions.
+            """
+        )
+        commands = argparser.add_subparsers(dest="command", required=True)
+        run = commands.add_parser("run", help="Run all benchmarks and save the results.")
+        run.add_argument("-o", "--output", type=str, metavar="FILE", default="benchmark.json",
+                         help="Results file (use it as baseline for later comparisons).")
+        compare = commands.add_parser("compare", help="Compare results with a baseline.")
+        compare.add_argument("baseline", type=str, metavar="BASELINE")
+        compare.add_argument("results", type=str, metavar="RESULTS")
+        compare.add_argument("--threshold", type=float, metavar="PERCENT", default=10.0,
+                             help="Flag metrics which got worse by more than PERCENT (exits with status 1).")
+
+        self.args = argparser.parse_args()
+
+
+# ========== ENTRY POINT ==========
+if __name__ == "__main__":
+    BenchmarkCommand().main()
+# =================================
@@ -0,0 +1,158 @@
+from array import array
+from map import IntMap
+
+
+class BitMap:
+    """Bitboard view of an IntMap, which moves all tiles of a type at once.
+
+    A state (board) is a tuple of integers: one bitmask of positions (bit row*width + col, see IntMap.vec2pos())
+    for each normal tile type in self.types, followed by one for the destroyer tiles, if any.
+    Boards are hashable, so they serve as exact keys (see key()).
+
+    A move shifts the masks by one position. Tiles in front of a wall stay, and so do tiles behind
+    a staying tile, which is resolved by shifting the staying tiles back until no tile is added
+    (once per tile in the longest chain). The map border is blocked, so shifts never wrap around.
+    """
+    def __init__(self, mp: IntMap):
+        self.map = mp
+        types = sorted(set(c % mp.NTYPES for c in mp.codes(mp.start)))
+        self.types = [typ for typ in types if typ != mp.DESTROYER_TYPE]  # type of each normal mask
+        self.typeindex = {typ: i for i, typ in enumerate(self.types)}
+        self.ntypes = len(self.types)
+        self.destroyertiles = mp.has_destroyer_tiles()
+        self.offsets = [-1, 1, -mp.width, mp.width]  # must be consistent with IntMap.DIRECTIONS!
+
+        ncells = mp.width*mp.height
+        self.destroyers = self.mask(mp.destroyers)
+        # positions from which normal tiles (destroyer tiles) can't move into each direction
+        self.blocked = [self.mask(pos for pos in range(ncells) if neighbours[pos] < 0) for neighbours in mp.neighbours]
+        self.destroyerblocked = [self.mask(pos for pos in range(ncells) if neighbours[pos] < 0 or neighbours[pos] in mp.destroyers)
+                                 for neighbours in mp.neighbours]
+
+        # position of each position in each mirror image (see IntMap.compile_symmetries())
+        self.posmaps = [[codemap[pos*mp.NTYPES] // mp.NTYPES for pos in range(ncells)]
+                        for codemap in mp.codemaps[1:]] if mp.symmetric else []
+
+        self.start = self.board(mp.start)
+        self.dest = self.board(mp.dest)[:self.ntypes]
+
+        # masks of the (region, type) slots of IntMap.needs, see IntMap.compile_regions()
+        self.slots = [[0, None] for _ in mp.needs]  # type: list[list]  # [mask of region, index of type mask]
+        for code, slot in enumerate(mp.regionneeds):
+            if slot >= 0:
+                self.slots[slot][0] |= 1 << mp.codepos[code]
+                self.slots[slot][1] = self.typeindex.get(code % mp.NTYPES)
+        self.needs = [(self.typeindex.get(typ), n) for typ, n in mp.desttypesn.items()]
+
+        # same checks as IntMap.compile_checks() (except the order in corridors, which is checked on the start only)
+        self.node_has_no_future = lambda board: not any(board)
+        if mp.count_regions:
+            self.node_has_no_future = lambda board: (not any(board)) or (not self.enough_region_tiles(board))
+        elif mp.count_tiles:
+            self.node_has_no_future = lambda board: (not any(board)) or (not self.enough_tiles(board))
+
+    @staticmethod
+    def mask(positions) -> int:
+        mask = 0
+        for pos in positions:
+            mask |= 1 << pos
+        return mask
+
+    @staticmethod
+    def positions(mask: int) -> list[int]:
+        """Set bits of mask in ascending order."""
+        positions = []
+        while mask:
+            low = mask & -mask
+            positions.append(low.bit_length() - 1)
+            mask ^= low
+        return positions
+
+    def board(self, tiles: bytes) -> tuple:
+        """Convert a packed state to a board."""
+        masks = [0]*(self.ntypes + self.destroyertiles)
+        for c in self.map.codes(tiles):
+            typ = c % self.map.NTYPES
+            i = self.ntypes if typ == self.map.DESTROYER_TYPE else self.typeindex[typ]
+            masks[i] |= 1 << self.map.codepos[c]
+        return tuple(masks)
+
+    def pack(self, board: tuple) -> bytes:
+        """Convert a board to a packed state."""
+        ntypes = self.map.NTYPES
+        types = self.types + [self.map.DESTROYER_TYPE]
+        codes = []
+        for i, mask in enumerate(board):
+            if i == self.ntypes:  # destroyer tiles are packed behind the normal tiles
+                codes.sort()
+            typ = types[i]
+            while mask:
+                low = mask & -mask
+                codes.append((low.bit_length() - 1)*ntypes + typ)
+                mask ^= low
+        if len(board) == self.ntypes:
+            codes.sort()
+        return array(self.map.codetype, codes).tobytes()
+
+    def key(self, board: tuple) -> tuple:
+        """Key of a board: the board itself, or the smallest of its mirror images on symmetric maps (see IntMap.canonical_key())."""
+        key = board
+        for posmap in self.posmaps:
+            mirrored = tuple([self.mask([posmap[pos] for pos in self.positions(mask)]) for mask in board])
+            if mirrored < key:
+                key = mirrored
+        return key
+
+    def shift(self, mask: int, dir: int) -> int:
+        """Move all positions of mask by one into direction dir."""
+        offset = self.offsets[dir]
+        return mask << offset if offset > 0 else mask >> -offset
+
+    def movelayer(self, masks: tuple, blocked: int, dir: int) -> list[int]:
+        """Move tiles of all masks, which block each other, into direction dir (see shift())."""
+        occupied = 0
+        for mask in masks:
+            occupied |= mask
+        stuck = occupied & blocked
+        offset = self.offsets[dir]
+        if offset > 0:
+            while True:
+                behind = (stuck >> offset) & occupied & ~stuck
+                if not behind:
+                    break
+                stuck |= behind
+            return [(mask & stuck) | ((mask & ~stuck) << offset) for mask in masks]
+        offset = -offset
+        while True:
+            behind = (stuck << offset) & occupied & ~stuck
+            if not behind:
+                break
+            stuck |= behind
+        return [(mask & stuck) | ((mask & ~stuck) >> offset) for mask in masks]
+
+    def move(self, board: tuple, dir: int) -> tuple:
+        """Return the board after moving into direction dir (see IntMap.move())."""
+        normal = self.movelayer(board[:self.ntypes], self.blocked[dir], dir)
+        killers = self.destroyers
+        if self.destroyertiles:
+            destroyers = self.movelayer(board[self.ntypes:], self.destroyerblocked[dir], dir)
+            killers |= destroyers[0]
+            return tuple([mask & ~killers for mask in normal] + destroyers)
+        return tuple([mask & ~killers for mask in normal])
+
+    def moves(self, board: tuple) -> list[tuple]:
+        """Return all possible moves as list[left, right, up, down]."""
+        return [self.move(board, dir) for dir in range(4)]
+
+    def solved(self, board: tuple) -> bool:
+        """True, if the normal tiles are in target position."""
+        return board[:self.ntypes] == self.dest
+
+    def enough_tiles(self, board: tuple) -> bool:
+        """True, if there are enough tiles of each type for the targets (see IntMap.enough_tiles())."""
+        return all(i is not None and board[i].bit_count() >= n for i, n in self.needs)
+
+    def enough_region_tiles(self, board: tuple) -> bool:
+        """True, if each region has enough tiles for its targets (see IntMap.enough_region_tiles())."""
+        return all(i is not None and (board[i] & region).bit_count() >= n
+                   for (region, i), n in zip(self.slots, self.map.needs))
@@ -1,6 +1,11 @@
 #!/bin/python3
 import sys
+import time
 from solver import Solver
+from transposition import TranspositionTable
+from memory import parse_size
+from telemetry import Telemetry, Profiler
+from solutioncache import SolutionCache
 import argparse
 
 
@@ -9,15 +14,39 @@ class BitLockSolve:
         self.parse_args()
 
     def main(self):
-        solver = Solver(self.args.mapfilename, treesize=self.args.tree_size, forgetfulsize=self.args.forgetful_size)
+        telemetry = None
+        if self.args.telemetry or self.args.profile:
+            profiler = Profiler(self.args.profile / 1000) if self.args.profile else None
+            telemetry = Telemetry(self.args.telemetry, profiler=profiler)
+        solutioncache = None
+        if self.args.solution_cache:
+            solutioncache = SolutionCache(self.args.solution_cache, self.args.solution_cache_size)
+        solver = Solver(self.args.mapfilename, treesize=self.args.tree_size, forgetfulsize=self.args.forgetful_size,
+                        keymode="exact" if self.args.exact_keys else "zobrist", engine=self.args.engine,
+                        workers=self.args.workers, algorithm=self.args.algorithm,
+                        memorybudget=self.args.memory_budget, scratchdir=self.args.scratch_dir,
+                        tablesize=self.args.table_size, eviction=self.args.table_eviction,
+                        symmetry=not self.args.no_symmetry, checkpoint=self.args.checkpoint,
+                        checkpointevery=self.args.checkpoint_every, resume=self.args.resume,
+                        telemetry=telemetry, mapcache=self.args.map_cache, patterns=not self.args.no_pattern_db,
+                        solutioncache=solutioncache)
 
         if self.args.walkthrough_path:  # just simulate walkthrough, do not solve
             solver.walkthrough(sys.argv[3])
             exit(0)
 
-        path = solver.solve()
-        if path is not False and self.args.walkthrough:
-            solver.walkthrough(path)
+        if self.args.verify:  # just replay paths, do not solve
+            exit(1 if solver.verify(self.args.verify) else 0)
+
+        deadline = time.time() + self.args.time_limit if self.args.time_limit else None
+        result = solver.solve(deadline)
+        print(result)
+        if telemetry is not None:
+            telemetry.close()
+            if telemetry.profiler is not None:
+                print(telemetry.profiler)
+        if result.path is not None and self.args.walkthrough:
+            solver.walkthrough(result.path)
 
     def parse_args(self):
         argparser = argparse.ArgumentParser(
@@ -27,16 +56,70 @@ class BitLockSolve:
             """
         )
         argparser.add_argument("mapfilename")
+        argparser.add_argument("--map-cache", type=str, metavar="DIR",
+                               help="Store compiled maps in DIR and load them from there next time.")
+        argparser.add_argument("--solution-cache", type=str, metavar="DIR",
+                               help="Store results in DIR and use them when the same map is solved again.")
+        argparser.add_argument("--solution-cache-size", type=self.size, metavar="SIZE", default=2**26,
+                               help="Remove least recently used results when the solution cache exceeds SIZE (default 64M).")
         argparser.add_argument("-w", "--walkthrough", action="store_true",
                                help="Walkthrough after completion")
         argparser.add_argument("-W", "--walkthrough-path", type=str, metavar="arrows",
                                help="Walk through given direction arrows (do not solve)")
+        argparser.add_argument("-V", "--verify", type=str, metavar="FILE",
+                               help="Replay the paths in FILE (arrows, one per line) and report which solve the map (do not solve).")
         argparser.add_argument("-t", "--tree-size", type=int, metavar="INT", default=15,
                                help="Maximum number of tree levels to memorize before forgetful iteration.")
+        argparser.add_argument("-m", "--memory-budget", type=self.size, metavar="SIZE",
+                               help="Stop memorizing tree levels before memory use exceeds SIZE (like 512M or 4G).")
         argparser.add_argument("-f", "--forgetful-size", type=int, metavar="INT", default=5,
                                help="Number of steps to simulate in forgetful iteration.")
+        argparser.add_argument("-T", "--table-size", type=int, metavar="N", default=2**20,
+                               help="Maximum number of constellations to remember in forgetful iteration (0 to disable).")
+        argparser.add_argument("--table-eviction", choices=TranspositionTable.EVICTIONS, default="deepest",
+                               help="Which constellation to forget if the table is full (deepest or least recently used).")
+        argparser.add_argument("-x", "--exact-keys", action="store_true",
+                               help="Store whole tile constellations instead of 64-bit fingerprints (no hash collisions, more memory).")
+        argparser.add_argument("--no-symmetry", action="store_true",
+                               help="Also search mirror images of constellations on symmetric maps.")
+        argparser.add_argument("-e", "--engine", choices=Solver.ENGINES, default="python",
+                               help="Engine for building the tree. numpy moves whole tree levels at once, "
+                                    "external also keeps them on disk, bitboard moves all tiles of a type at once with bitmasks.")
+        argparser.add_argument("-s", "--scratch-dir", type=str, metavar="DIR",
+                               help="Directory for tree levels of the external engine (default: system temp directory).")
+        argparser.add_argument("-j", "--workers", type=int, metavar="N", default=1,
+                               help="Number of worker processes for building the tree (python engine) and for forgetful iteration.")
+        argparser.add_argument("-a", "--algorithm", choices=Solver.ALGORITHMS, default="bfs",
+                               help="Search algorithm. bidirectional also searches backwards from the target (no destroyers), "
+                                    "astar and idastar are guided by distances of each tile to the targets.")
+        argparser.add_argument("--no-pattern-db", action="store_true",
+                               help="Guide astar and idastar only by distances of single tiles, not by the distances of "
+                                    "pairs of tiles of the same type (pattern database, stored with --map-cache).")
+
+        argparser.add_argument("-c", "--checkpoint", type=str, metavar="DIR",
+                               help="Save the search state to DIR after each tree level and during forgetful iteration.")
+        argparser.add_argument("--checkpoint-every", type=int, metavar="N", default=1000,
+                               help="Number of leaves of forgetful iteration between checkpoints.")
+        argparser.add_argument("-r", "--resume", action="store_true",
+                               help="Continue from the checkpoint in the directory given by --checkpoint.")
+        argparser.add_argument("--time-limit", type=float, metavar="SECONDS",
+                               help="Stop after SECONDS and print the best path found so far (not proven optimal).")
+        argparser.add_argument("--telemetry", type=str, metavar="FILE",
+                               help="Write an event per tree level and per leaf of forgetful iteration to FILE (JSON lines).")
+        argparser.add_argument("--profile", type=float, metavar="MS", nargs="?", const=1.0,
+                               help="Sample the running code every MS milliseconds of CPU time (default 1) and print "
+                                    "the share of move generation, duplicate detection and pruning.")
 
         self.args = argparser.parse_args()
+        if self.args.resume and not self.args.checkpoint:
+            argparser.error("--resume needs --checkpoint DIR")
+
+    @staticmethod
+    def size(text):
+        try:
+            return parse_size(text)
+        except ValueError as error:
+            raise argparse.ArgumentTypeError(str(error))
 
 
 # ========== ENTRY POINT ==========
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+from array import array
+import numpy as np
+from node import StateList
+
+
+class Checkpoint:
+    """Search state on disk, to resume an interrupted solve.
+
+    The directory holds:
+    - level<i>.npz: (parent indices, edges) of tree level i (see IndexedNode), written once.
+    - frontier<height>.npz: the states and keys of the last level (see StateList).
+    - seen.keys (zobrist keys), or seen.data and seen.ends (packed states and their ends, see StateList):
+      the seen keys, to which the keys of each new level are appended.
+    - state.json: the settings of the solve (which have to match to resume it), the number of saved levels
+      and seen keys, whether the tree is complete, and the progress of forgetful iteration
+      (next leaf, maximum length and best path). It is replaced atomically and written last,
+      so files (and appended keys) it doesn't refer to yet are ignored.
+    """
+    def __init__(self, directory: str, settings: dict):
+        self.directory = directory
+        self.settings = settings  # type: dict  # must be JSON serializable
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def hashfile(filename: str) -> str:
+        with open(filename, 'rb') as file:
+            return hashlib.sha256(file.read()).hexdigest()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def write(self, name: str, write, offset: int = None) -> None:
+        """Write a file with write(file), or append to it at offset (cutting off what a crash left behind)."""
+        with open(self.path(name), 'wb' if offset is None else 'r+b') as file:
+            if offset is not None:
+                file.truncate(offset)
+                file.seek(offset)
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def replace(self, name: str, write) -> None:
+        """Write a file with write(file) and replace name with it, so there is always a complete checkpoint."""
+        temporary = self.path(name + ".tmp")
+        with open(temporary, 'wb') as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path(name))
+
+    def save_tree(self, levels: list[tuple], frontier: StateList, seen, complete: bool, saved: int = 0) -> None:
+        """Save the tree after a completed level. complete is True, if no more levels will be built.
+
+        ## Parameters:
+        saved: (int) number of levels saved before (by the previous call or found by load_tree()).
+        seen: keys added to the seen set since then (all keys, if saved is 0).
+        """
+        nseen = self.load_state()['seen'] if saved else [0, 0]  # number of keys, bytes of seendata
+        for i in range(saved, len(levels)):
+            parents, edges = levels[i]
+            self.write(f"level{i}.npz", lambda file: np.savez(file, parents=np.asarray(parents, dtype=np.uint32),
+                                                               edges=np.asarray(edges, dtype=np.uint8)))
+        arrays = {'ends': np.asarray(frontier.ends, dtype=np.uint64),
+                  'data': np.frombuffer(bytes(frontier.data), dtype=np.uint8)}
+        if frontier.keys is not None:
+            arrays['keys'] = np.asarray(frontier.keys, dtype=np.uint64)
+        self.write(f"frontier{len(levels)}.npz", lambda file: np.savez(file, **arrays))
+
+        if frontier.keys is not None:  # zobrist keys
+            keys = array('Q', seen)
+            self.write("seen.keys", keys.tofile, offset=nseen[0]*keys.itemsize if saved else None)
+            nseen = [nseen[0] + len(keys), 0]
+        else:  # packed states
+            seenstates = StateList('exact')
+            for tiles in seen:
+                seenstates.append(tiles, tiles)
+            ends = array('Q', (nseen[1] + end for end in seenstates.ends))
+            self.write("seen.data", lambda file: file.write(seenstates.data), offset=nseen[1] if saved else None)
+            self.write("seen.ends", ends.tofile, offset=nseen[0]*ends.itemsize if saved else None)
+            nseen = [nseen[0] + len(ends), nseen[1] + len(seenstates.data)]
+
+        self.save_state({'height': len(levels), 'seen': nseen, 'complete': complete, 'forgetful': None})
+        if saved != len(levels) and os.path.exists(self.path(f"frontier{saved}.npz")):
+            os.remove(self.path(f"frontier{saved}.npz"))
+
+    def save_progress(self, leaf: int, maxlength: int, path: list or False) -> None:
+        """Save the progress of forgetful iteration: index of the next leaf, maximum length and best path."""
+        state = self.load_state()
+        state['forgetful'] = {'leaf': leaf, 'maxlength': maxlength, 'path': path}
+        self.save_state(state)
+
+    def save_state(self, state: dict) -> None:
+        state['settings'] = self.settings
+        self.replace("state.json", lambda file: file.write(json.dumps(state).encode()))
+
+    def load_state(self) -> dict or None:
+        """Load state.json (None if there is no checkpoint). Exits, if it belongs to another solve."""
+        if not os.path.exists(self.path("state.json")):
+            return None
+        with open(self.path("state.json")) as file:
+            state = json.load(file)
+        if state['settings'] != self.settings:
+            print(f"ERROR: checkpoint in {self.directory} belongs to another map or other settings")
+            exit(10)
+        return state
+
+    def load_tree(self, keymode: str) -> tuple or None:
+        """Load the saved tree.
+
+        ## Returns
+        - tuple (levels, frontier, seen, complete) (see save_tree()),
+        - None, if there is no checkpoint.
+        """
+        state = self.load_state()
+        if state is None:
+            return None
+        levels = []
+        for i in range(state['height']):
+            with np.load(self.path(f"level{i}.npz")) as arrays:
+                levels.append((arrays['parents'], arrays['edges']))
+        frontier = StateList(keymode)
+        with np.load(self.path(f"frontier{state['height']}.npz")) as arrays:
+            frontier.data = bytearray(arrays['data'].tobytes())
+            frontier.ends = array('Q', arrays['ends'].tobytes())
+            if frontier.keys is not None:
+                frontier.keys = array('Q', arrays['keys'].tobytes())
+        nkeys, ndata = state['seen']
+        if frontier.keys is not None:
+            seen = set(np.fromfile(self.path("seen.keys"), dtype=np.uint64, count=nkeys).tolist())
+        else:
+            seenstates = StateList('exact')
+            with open(self.path("seen.data"), 'rb') as file:
+                seenstates.data = bytearray(file.read(ndata))
+            seenstates.ends = array('Q', np.fromfile(self.path("seen.ends"), dtype=np.uint64, count=nkeys).tobytes())
+            seen = set(tiles for tiles, _ in seenstates)
+        return levels, frontier, seen, state['complete']
+
+    def load_progress(self) -> dict or None:
+        """Progress of forgetful iteration (see save_progress()), or None if it hasn't started."""
+        state = self.load_state()
+        return state['forgetful'] if state is not None else None
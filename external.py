@@ -0,0 +1,134 @@
+import os
+import numpy as np
+from frontier import VectorMap
+
+
+class ExternalSearch:
+    """Breadth-first search, which keeps all tree levels on disk (external-memory BFS).
+
+    Each level is stored as three files in a scratch directory: the sorted exact keys of its
+    constellations (which can be converted back to rows, see VectorMap.unkeys()), and the parent
+    index and edge of each node (see IndexedNode). A level is expanded chunk by chunk, and every
+    chunk is written as a sorted run. The runs are merged block by block, dropping duplicates
+    within the level and against the memory-mapped keys of all earlier levels (delayed duplicate
+    detection), so only single blocks are held in memory.
+    """
+    BLOCKSIZE = 2**16  # number of states to hold in memory at once
+    FIELDS = ['keys', 'parents', 'edges']
+
+    def __init__(self, vmap: VectorMap, directory: str):
+        self.vmap = vmap
+        self.directory = directory
+        self.dtypes = {'keys': vmap.keyview, 'parents': np.dtype(np.uint32), 'edges': np.dtype(np.uint8)}
+        self.nlevels = 0  # number of stored levels (including the root level)
+
+    def path(self, name: str, field: str) -> str:
+        return os.path.join(self.directory, f"{name}.{field}")
+
+    def read(self, name: str, field: str) -> np.ndarray:
+        """Memory-map one field of a level or run (read-only)."""
+        path = self.path(name, field)
+        if os.path.getsize(path) == 0:
+            return np.empty(0, dtype=self.dtypes[field])  # mmap can't map empty files
+        return np.memmap(path, dtype=self.dtypes[field], mode='r')
+
+    def write(self, name: str, keys: np.ndarray, parents: np.ndarray, edges: np.ndarray, append: bool = False) -> None:
+        """Write (or append) keys, parents and edges of a level or run."""
+        for field, values in zip(self.FIELDS, [keys, parents, edges]):
+            with open(self.path(name, field), 'ab' if append else 'wb') as file:
+                np.ascontiguousarray(values, dtype=self.dtypes[field]).tofile(file)
+
+    def start(self, rows: np.ndarray) -> None:
+        """Set root level."""
+        keys = np.unique(self.vmap.keys(rows))
+        self.write("0", keys, np.zeros(len(keys)), np.zeros(len(keys)))
+        self.nlevels = 1
+
+    def levels(self) -> list[tuple]:
+        """Memory-mapped (parent indices, edges) of all levels below the root (see IndexedNode)."""
+        return [(self.read(str(level), 'parents'), self.read(str(level), 'edges')) for level in range(1, self.nlevels)]
+
+    def leaves(self):
+        """Iterate over the rows of the last level in blocks."""
+        keys = self.read(str(self.nlevels - 1), 'keys')
+        for offset in range(0, len(keys), self.BLOCKSIZE):
+            yield self.vmap.unkeys(np.array(keys[offset:offset+self.BLOCKSIZE]))
+
+    def expand(self, check=None) -> tuple:
+        """Build next tree level.
+        check() is called before each chunk and block (if given), it may raise to stop.
+
+        ## Returns
+        tuple (number of new leaves, solution), where solution is (parent index, edge) of a
+        solved constellation in the new level, or None.
+        """
+        vmap = self.vmap
+        runs = []  # type: list[str]
+        offset = 0
+        for chunk in self.leaves():
+            if check is not None:
+                check()
+            rows = vmap.moves(chunk).reshape(-1, vmap.width)
+            parents = np.tile(np.arange(offset, offset+len(chunk), dtype=np.uint32), 4)
+            edges = np.repeat(np.arange(4, dtype=np.uint8), len(chunk))
+            offset += len(chunk)
+
+            alive = ~vmap.node_has_no_future(rows)
+            rows, parents, edges = rows[alive], parents[alive], edges[alive]
+            solved = np.flatnonzero(vmap.solved(rows))
+            if len(solved) > 0:
+                self.remove(runs)
+                return 0, (parents[solved[0]], edges[solved[0]])
+
+            keys, first = np.unique(vmap.keys(rows), return_index=True)
+            runs.append(f"run{len(runs)}")
+            self.write(runs[-1], keys, parents[first], edges[first])
+
+        nnew = self.merge(runs, str(self.nlevels), check)
+        self.remove(runs)
+        self.nlevels += 1
+        return nnew, None
+
+    def merge(self, runs: list[str], name: str, check=None) -> int:
+        """Merge sorted runs into a new level, dropping duplicates and keys of earlier levels.
+        Among duplicates, the one of the first run (i.e. lowest parent index) is kept.
+        check() is called before each block (if given).
+
+        ## Returns
+        number of nodes in the new level.
+        """
+        runs = [tuple(self.read(run, field) for field in self.FIELDS) for run in runs]
+        earlier = [self.read(str(level), 'keys') for level in range(self.nlevels)]
+        positions = [0]*len(runs)
+        self.write(name, [], [], [])
+        nnew = 0
+        while True:
+            unfinished = [r for r, (keys, _, _) in enumerate(runs) if positions[r] < len(keys)]
+            if not unfinished:
+                return nnew
+            if check is not None:
+                check()
+            # take all keys up to the smallest last key of the next blocks, so equal keys end up in the same block
+            lastkeys = [runs[r][0][min(positions[r]+self.BLOCKSIZE, len(runs[r][0]))-1] for r in unfinished]
+            splitter = np.sort(np.array(lastkeys, dtype=self.vmap.keyview))[:1]
+            parts = []
+            for r in unfinished:
+                start = positions[r]
+                end = start + int(np.searchsorted(runs[r][0][start:start+self.BLOCKSIZE], splitter, side='right')[0])
+                parts.append([np.array(field[start:end]) for field in runs[r]])
+                positions[r] = end
+            keys, first = np.unique(np.concatenate([p[0] for p in parts]), return_index=True)
+            new = np.ones(len(keys), dtype=bool)
+            for seen in earlier:  # streaming: only the matching key range of each level is read
+                lo = int(np.searchsorted(seen, keys[:1])[0])
+                hi = int(np.searchsorted(seen, keys[-1:], side='right')[0])
+                new &= ~self.vmap.contains(np.array(seen[lo:hi]), keys)
+            first = first[new]
+            self.write(name, keys[new], np.concatenate([p[1] for p in parts])[first],
+                       np.concatenate([p[2] for p in parts])[first], append=True)
+            nnew += len(first)
+
+    def remove(self, runs: list[str]) -> None:
+        for run in runs:
+            for field in self.FIELDS:
+                os.remove(self.path(run, field))
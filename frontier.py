@@ -0,0 +1,159 @@
+import numpy as np
+from map import IntMap
+
+
+class VectorMap:
+    """Vectorized view of an IntMap, which moves whole tree levels at once.
+
+    A level is a 2D integer array (states x tiles) of tile codes (see IntMap).
+    Each row holds the sorted codes of the normal tiles, padded with PAD for destroyed tiles,
+    followed by the sorted codes of the destroyer tiles (which never get destroyed).
+    All tables of the IntMap get an additional last entry for PAD, so PAD and -1 (blocked)
+    can be used as index as well.
+    """
+    def __init__(self, mp: IntMap):
+        self.map = mp
+        ncodes = len(mp.codepos)
+        self.PAD = ncodes
+        self.ndestroyertiles = mp.ndestroyertiles
+        self.width = len(mp.codes(mp.start))
+        self.nnormal = self.width - self.ndestroyertiles
+
+        self.codepos = np.array(list(mp.codepos) + [-1], dtype=np.int32)
+        self.codetypes = np.append(np.arange(ncodes, dtype=np.int32) % mp.NTYPES, np.int32(-1))
+        self.lethal = np.array(list(mp.lethal) + [0], dtype=bool)
+        self.steps = [np.array(list(steps) + [-1], dtype=np.int32) for steps in mp.steps]
+        self.destroyersteps = [np.array(list(steps) + [-1], dtype=np.int32) for steps in mp.destroyersteps]
+
+        dest = list(mp.codes(mp.dest))
+        self.destrow = np.array(dest + [self.PAD]*(self.nnormal - len(dest)), dtype=np.int32)
+        self.ndest = len(dest)
+        self.desttypesn = mp.desttypesn
+        self.count_types = mp.count_tiles and not mp.count_regions  # see IntMap.setup()
+        self.count_regions = mp.count_regions
+        self.regionneeds = np.array(list(mp.regionneeds) + [-1], dtype=np.int32)
+        self.needs = list(mp.needs)
+
+        self.codemaps = [np.array(list(codemap) + [self.PAD], dtype=np.int32) for codemap in mp.codemaps[1:]]
+        if not mp.symmetric:
+            self.codemaps = []
+
+        # big-endian, so keys are ordered like rows
+        self.keytype = np.dtype('>u2') if mp.codetype == 'H' else np.dtype('>u4')
+        self.keyview = np.dtype((np.void, self.width*self.keytype.itemsize))
+
+    def rows(self, states: list[bytes]) -> np.ndarray:
+        """Convert packed states to a level array."""
+        rows = np.full((len(states), self.width), self.PAD, dtype=np.int32)
+        for i, tiles in enumerate(states):
+            codes = self.map.codes(tiles)
+            split = len(codes) - self.ndestroyertiles
+            rows[i, :split] = codes[:split]
+            rows[i, self.nnormal:] = codes[split:]
+        return rows
+
+    def states(self, rows: np.ndarray) -> list[bytes]:
+        """Convert a level array to packed states."""
+        codetype = np.uint16 if self.map.codetype == 'H' else np.uint32
+        padded = rows == self.PAD
+        order = np.argsort(padded, axis=1, kind='stable')  # move padding to the end
+        buffer = np.take_along_axis(rows, order, axis=1).astype(codetype).tobytes()
+        rowsize = self.width * np.dtype(codetype).itemsize
+        ends = (self.width - padded.sum(axis=1)) * np.dtype(codetype).itemsize
+        return [buffer[i*rowsize:i*rowsize+end] for i, end in enumerate(ends.tolist())]
+
+    def keys(self, rows: np.ndarray) -> np.ndarray:
+        """Return a 1D array of exact keys (void scalars) of the rows."""
+        return np.ascontiguousarray(rows.astype(self.keytype)).view(self.keyview).ravel()
+
+    def canonical_keys(self, rows: np.ndarray) -> np.ndarray:
+        """Return exact keys of the smallest mirror image of each row (see IntMap.compile_symmetries()).
+        Same as keys(), if the map has no symmetries.
+        """
+        best = rows
+        for codemap in self.codemaps:
+            image = codemap[rows]
+            image[:, :self.nnormal].sort(axis=1)
+            image[:, self.nnormal:].sort(axis=1)
+            differ = image != best
+            first = differ.argmax(axis=1)[:, None]  # first differing column
+            smaller = np.take_along_axis(image, first, axis=1) < np.take_along_axis(best, first, axis=1)
+            best = np.where(smaller & differ.any(axis=1)[:, None], image, best)
+        return self.keys(best)
+
+    def unkeys(self, keys: np.ndarray) -> np.ndarray:
+        """Convert keys back to a level array."""
+        return keys.view(self.keytype).reshape(-1, self.width).astype(np.int32)
+
+    def moves(self, rows: np.ndarray) -> np.ndarray:
+        """Return all possible moves of all rows with shape (4, states, tiles).
+        Directions are in the order of IntMap.DIRECTIONS.
+        """
+        result = np.empty((4,) + rows.shape, dtype=rows.dtype)
+        for dir in range(4):
+            result[dir] = self.move(rows, dir)
+        return result
+
+    def move(self, rows: np.ndarray, dir: int) -> np.ndarray:
+        """Return the rows after moving in direction dir (see IntMap.move())."""
+        result = np.empty_like(rows)
+        newnormal = self.movelayer(rows[:, :self.nnormal], self.steps[dir])
+        dead = self.lethal[newnormal]
+        if self.ndestroyertiles:
+            newdestroyers = self.movelayer(rows[:, self.nnormal:], self.destroyersteps[dir])
+            newdestroyers.sort(axis=1)
+            killers = self.codepos[newdestroyers]  # type: np.ndarray  # (states, destroyer tiles)
+            dead |= (self.codepos[newnormal][:, :, None] == killers[:, None, :]).any(axis=2)
+            result[:, self.nnormal:] = newdestroyers
+        newnormal[dead] = self.PAD
+        newnormal.sort(axis=1)
+        result[:, :self.nnormal] = newnormal
+        return result
+
+    def movelayer(self, codes: np.ndarray, steps: np.ndarray) -> np.ndarray:
+        """Move tiles which block each other according to steps.
+
+        A tile is blocked if its step is blocked, or if the tile in front of it is blocked.
+        This is the same as moving the front-most tiles first (see IntMap.moves()),
+        because only the tile itself can move into the cell it leaves.
+        """
+        pos = self.codepos[codes]
+        target = steps[codes]
+        ahead = self.codepos[target][:, :, None] == pos[:, None, :]  # (states, tile, tile in front)
+        hasahead = ahead.any(axis=2)
+        front = ahead.argmax(axis=2)  # index of the tile in front
+        blocked = target < 0
+        for _ in range(codes.shape[1]):  # a chain of blocked tiles is at most this long
+            newblocked = blocked | (hasahead & np.take_along_axis(blocked, front, axis=1))
+            if (newblocked == blocked).all():
+                break
+            blocked = newblocked
+        return np.where(blocked, codes, target)
+
+    def solved(self, rows: np.ndarray) -> np.ndarray:
+        """Boolean mask of rows with game tiles in target position (see IntMap.solved())."""
+        return (rows[:, :self.nnormal] == self.destrow).all(axis=1)
+
+    def node_has_no_future(self, rows: np.ndarray) -> np.ndarray:
+        """Boolean mask of rows which can't lead to solution anymore (see IntMap.setup())."""
+        ntiles = (rows != self.PAD).sum(axis=1)
+        nofuture = ntiles == 0
+        if self.count_types:
+            nofuture |= ntiles < self.ndest
+            types = self.codetypes[rows]
+            for typ, n in self.desttypesn.items():
+                nofuture |= (types == typ).sum(axis=1) < n
+        if self.count_regions:
+            slots = self.regionneeds[rows]
+            for slot, n in enumerate(self.needs):
+                nofuture |= (slots == slot).sum(axis=1) < n
+        return nofuture
+
+    @staticmethod
+    def contains(sortedkeys: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        """Boolean mask of keys which are in the sorted array sortedkeys."""
+        if len(sortedkeys) == 0:
+            return np.zeros(len(keys), dtype=bool)
+        i = np.searchsorted(sortedkeys, keys)
+        i[i == len(sortedkeys)] = 0
+        return sortedkeys[i] == keys
@@ -1,10 +1,17 @@
 from abc import ABC
-import numpy as np
+from array import array
+import random
+import itertools
+import json
 from collections import Counter
+from mapcache import MapCache
 
 class Tile:
     """Represents a game tile. Equal to other tile if positions and type are same.
-    Equal to integer if integer==position."""
+    Equal to integer if integer==position.
+    Tiles are views of integer codes, IntMap.tile() creates a new instance per call."""
+    __slots__ = ('type', 'pos')
+
     def __init__(self, typ, pos):
         self.type = typ  # for distinguishing between tiles. 26 for destroyer tile
         self.pos = pos
@@ -18,7 +25,7 @@ class Tile:
         return (self.pos == other.pos) and (self.type == other.type)
     
     def __hash__(self):
-        return hash(frozenset([self.pos, self.type]))
+        return hash((self.pos, self.type))
 
     def __lt__(self, other):
         return self.pos < other.pos  # for sorting
@@ -31,45 +38,14 @@ class TileList(list):
     def __add__(self, other):
         return TileList(super().__add__(other))
 
-    def copy(self):
-        """Return a TileList of new, equal Tile instances."""
-        return TileList([Tile(t.type, t.pos) for t in self])
-
     def hashable(self) -> hashabletype:
         """Return a hashable set of this list."""
         return self.hashabletype(self)
 
-    def dist(self, other, mp) -> float:
-        """Distance to other TileList.
-        
-        Distance between two tiles is l2-norm + 1.
-        Distance between two sets of indistinguishable tiles is the product of all distances.
-        Distance between all tiles is the sum of all distances between all sets of tiles.
-        """
-        # calculate norm between all positions
-        selfvecs = np.array([mp.pos2vec(st.pos) for st in self])[None]  # shape: (1, N, 2)
-        selfvecs = np.transpose(selfvecs, [2, 1, 0])  # shape: (2, N, 1)
-        othervecs = np.array([mp.pos2vec(ot.pos) for ot in other])[None]  # shape: (1, K, 2)
-        othervecs = np.transpose(othervecs, [2, 0, 1])  # shape: (2, 1, K)
-        norm1 = np.linalg.norm(selfvecs - othervecs, axis=0) + 1  # shape: (N, K)
-
-        # extract types for comparing (in-)distinguishable tiles
-        selftypes = np.array([st.type for st in self])  # shape: (N,)
-        othertypes = np.array([ot.type for ot in other])  # shape: (K,)
-        alltypes = set(list(selftypes) + list(othertypes))  # length: L (depends on repeated types)
-
-        # sum over all set-distances
-        dist = 0
-        for typ in alltypes:
-            setdist = np.prod(norm1[selftypes==typ,:][:,othertypes==typ])
-            dist += setdist
-
-        return dist
-
 
 class Map(ABC):
-    def moves(self, pos, func) -> list[TileList.hashabletype]:
-        """Move each pos in tiles in all 4 directions and return a list of 4 sets of tiles."""
+    def moves(self, tiles) -> list[bytes]:
+        """Move tiles in all 4 directions and return a list of 4 packed states."""
         pass
 
     def load(self, filename):
@@ -80,38 +56,54 @@ class Map(ABC):
 
 
 class IntMap(Map):
-    """A map where each position is represented by an integer."""
+    """A map where each position is represented by an integer.
+
+    Tile constellations (states) are stored packed: every tile is encoded as
+    code=pos*NTYPES+type and the sorted codes of normal tiles, followed by the sorted
+    codes of destroyer tiles, are packed into a bytes object. This canonical encoding
+    is used as state everywhere in the solver. For duplicate detection each state has
+    a key, which is either the state itself (exact mode) or a 64-bit Zobrist
+    fingerprint, which is updated incrementally while moving.
+    On maps with symmetries (see compile_symmetries()) the key of a state is the
+    key of a canonical representative of all its mirror images, if enabled.
+
+    Moves are computed on the tile codes with tables compiled in setup(), which map
+    each code to its moved code (or -1 if blocked by a wall).
+    """
     DIRECTIONS = ['←', '→', '↑', '↓']
     START_CHARS = [chr(ord('a')+i) for i in range(26)] + ['*']  # index 26 is destroyer tile
     DEST_CHARS = [chr(ord('A')+i) for i in range(26)]
     OBSTACLE_CHAR = '#'
     DESTROYER_CHAR = '+'
-
-    def __init__(self, filename=None, width=None, height=None, obstacles=None, start=None, dest=None):
-        self.dir_funcs = [self.__left, self.__right, self.__up, self.__down]
+    NTYPES = len(START_CHARS)
+    DESTROYER_TYPE = 26
+    BACKWARDS = [False, True, False, True]  # move right- and bottom-most tiles first for right and down
+    OPPOSITE = [1, 0, 3, 2]  # opposite direction of each direction
+    UNREACHABLE = 2**16 - 1  # distance of unreachable positions
+    KEYMODES = ['zobrist', 'exact']
+    ZOBRIST_SEED = 0x5eed  # fixed, so keys are reproducible between runs
+
+    def __init__(self, filename=None, width=None, height=None, obstacles=None, start=None, dest=None, *,
+                 destroyers=None, keymode='zobrist', symmetry=False, cachedir=None):
+        self.keymode = keymode
+        self.symmetry = symmetry  # use canonical keys of mirror images
         self.node_has_no_future = lambda tiles: not self.notzero_tiles(tiles)
-        self.destroy_tiles = self.destroy_tiles_onlyblocks
-        self.newpos_valid = lambda tile, newpos, tiles: not self.in_obstacle(newpos) and self.valid_with_othertiles(newpos, tiles)
-        if filename is not None:
+        if filename is not None and cachedir is not None:
+            MapCache(cachedir).load(self, filename)
+        elif filename is not None:
             self.load(filename)
         else:
-            self.width = width
-            self.height = height
-            self.obstacles = obstacles
-            self.start = start  # type: TileList.hashabletype  # a set of tiles in starting position
-            self.dest = dest  # type: TileList.hashabletype  # a set of tiles in target position
+            self.setup(width, height, obstacles, destroyers or [], start, dest)
 
     def __str__(self) -> str:
         return self.str()
 
     def str(self, tiles = None) -> str:
         if tiles is None:
-            tiles = []  # cannot use mutable object as default
+            tiles = self.pack([])  # cannot use mutable object as default
         textmap = [self.width*[' '] for _ in range(self.height)]
         # convert to list so we can search for positions
-        startlist = list(self.start)
-        destlist = list(self.dest)
-        startpositions = [t.pos for t in startlist]
+        destlist = list(self.unpack(self.dest))
         destpositions = [t.pos for t in destlist]
         for h in range(self.height):
             for w in range(self.width):
@@ -120,15 +112,12 @@ class IntMap(Map):
                     textmap[h][w] = self.OBSTACLE_CHAR
                 elif pos in self.destroyers:
                     textmap[h][w] = self.DESTROYER_CHAR
-                #elif pos in startpositions:  # don't print start positions
-                #    tile = startlist[startpositions.index(pos)]  # extract tile to get type
-                #    textmap[h][w] = self.START_CHARS[tile.type]
                 elif pos in destpositions:
                     tile = destlist[destpositions.index(pos)]  # extract tile to get type
                     textmap[h][w] = self.DEST_CHARS[tile.type]
         
         # overwrite with current tiles
-        for tile in tiles:
+        for tile in self.unpack(tiles):
             vec = self.pos2vec(tile.pos)
             h = vec[0]
             w = vec[1]
@@ -142,147 +131,555 @@ class IntMap(Map):
     def strpath(self, path_indices) -> str:
         return "".join([self.DIRECTIONS[i] for i in path_indices])
 
-    def moves(self, tiles) -> list[TileList.hashabletype]:
-        """Return all possible moves as list[left, right, up, down]."""
-        # ascending sort, because for left and up movement the upper and left-most tiles
-        # have to be moved first (to prevent collision with a tile which could
-        # actually be moved).
-        tiles = TileList(sorted(tiles))
-        left = self.__move(tiles.copy(), self.__left)
-        up = self.__move(tiles.copy(), self.__up)
-        tiles = TileList(tiles[::-1])  # reverse order for right and down
-        right = self.__move(tiles.copy(), self.__right)
-        down = self.__move(tiles.copy(), self.__down)
-        return [left, right, up, down]  # must be consistent with self.DIRECTIONS!
-
-    def move(self, tiles, dir):
-        return self.__move(tiles, self.dir_funcs[dir])
-
-    def __move(self, tiles: TileList, func) -> TileList.hashabletype:
-        """Move each pos in tiles according to func, if possible.
-        Assumes correctly sorted TileList.
-        """
-        for tile in tiles:
-            newpos = func(tile.pos)  # type: int
-            if self.newpos_valid(tile, newpos, tiles):
-                tile.pos = newpos
-        tiles = self.destroy_tiles(tiles)
-        return tiles.hashable()  # make tiles hashable
-
-    def newpos_valid(self, tile, newpos, tiles) -> bool:
-        """True, if newly calculated position is valid."""
-        pass  # set in __init__() and load()
-    
-    def valid_with_destroyertiles(self, tile: Tile, newpos: int, tiles: TileList) -> bool:
-        """True, if newly calculated position is valid according to other tiles, destroyer tiles and destroyer blocks on map."""
-        is_destroyer = tile.is_destroyer()
-        if is_destroyer:
-            if newpos in self.destroyers:
-                return False  # destroyer tiles cannot move through destroyer blocks
-        if newpos in tiles:
-            othertile = tiles[tiles.index(newpos)]  # type: Tile
-            if is_destroyer == othertile.is_destroyer():
-                return False  # tiles only collide if different type (destroyer or not)
-        return True
+    def code(self, tile: Tile) -> int:
+        """Integer code of a tile, unique for position and type."""
+        return tile.pos*self.NTYPES + tile.type
 
-    def valid_with_othertiles(self, newpos: int, tiles: TileList) -> bool:
-        """True if newly calculated position is not inside another tile."""
-        return not (newpos in tiles)
+    def codes(self, tiles: bytes) -> array:
+        """Unpack a state into its tile codes."""
+        return array(self.codetype, tiles)
 
-    def in_obstacle(self, pos: int) -> bool:
-        """True, if pos is inside an obstacle"""
-        return pos in self.obstacles
+    def pack(self, tiles) -> bytes:
+        """Return the canonical packed state of an iterable of tiles."""
+        normal = sorted(self.code(t) for t in tiles if not t.is_destroyer())
+        destroyers = sorted(self.code(t) for t in tiles if t.is_destroyer())
+        return array(self.codetype, normal + destroyers).tobytes()
 
-    def destroy_tiles(self, tiles: TileList) -> TileList:
-        """Let destroyer tiles and blocks destroy tiles."""
-        pass  # set in __init__() and load()
+    def tile(self, code: int) -> Tile:
+        """Tile of an integer code (see code())."""
+        return Tile(code % self.NTYPES, code // self.NTYPES)
 
-    def destroy_tiles_onlyblocks(self, tiles: TileList) -> TileList:
-        """Let destroyer blocks destroy tiles."""
-        return TileList(filter(lambda t: t.pos not in self.destroyers, tiles))
-    
-    def destroy_tiles_with_destroyertiles(self, tiles: TileList) -> TileList:
-        """Filter tiles destroyed by destroyer tiles and blocks."""
-        destroyer_tiles = TileList(filter(lambda t: t.is_destroyer(), tiles))
-        normal_tiles = TileList(filter(lambda t: not t.is_destroyer(), tiles))  # can this partitioning be done faster?
-        survived = lambda t: (
-            (t.pos not in self.destroyers) and  # not destroyed by block
-            (t.pos not in destroyer_tiles)  # not destroyed by tile
-        )
-        # destroyer tiles always survive
-        return destroyer_tiles + TileList(filter(survived, normal_tiles))
-
-    def __left(self, pos) -> int:
-        return pos-1
-
-    def __right(self, pos) -> int:
-        return pos+1
+    def unpack(self, tiles: bytes) -> TileList:
+        """Return a TileList of the tiles of a packed state."""
+        return TileList([self.tile(c) for c in self.codes(tiles)])
 
-    def __up(self, pos) -> int:
-        return pos-self.width
+    def key(self, tiles: bytes):
+        """Return the key of a packed state, which is used for duplicate detection.
+        Mirror images of a state have the same key, if the map is symmetric (see compile_symmetries()).
+        """
+        if self.symmetric:
+            return self.canonical_key(tiles)
+        if self.keymode == 'exact':
+            return tiles
+        key = 0
+        for c in self.codes(tiles):
+            key ^= self.zobrist[c]
+        return key
+
+    def canonical_key(self, tiles: bytes):
+        """Return the smallest key of all mirror images of a packed state."""
+        codes = self.codes(tiles)
+        if self.keymode == 'exact':
+            split = len(codes) - self.ndestroyertiles
+            images = []
+            for codemap in self.codemaps:
+                image = array(self.codetype, sorted(codemap[c] for c in codes[:split]))
+                image.extend(sorted(codemap[c] for c in codes[split:]))
+                images.append(image.tobytes())
+            return min(images)
+        keys = []
+        for zobrist in self.zobrists:
+            key = 0
+            for c in codes:
+                key ^= zobrist[c]
+            keys.append(key)
+        return min(keys)
+
+    def moves(self, tiles: bytes) -> list[bytes]:
+        """Return all possible moves as list[left, right, up, down]."""
+        return [newtiles for newtiles, _ in self.keyed_moves(tiles, None)]
 
-    def __down(self, pos) -> int:
-        return pos+self.width
+    def keyed_moves(self, tiles: bytes, key) -> list[tuple]:
+        """Return all possible moves with their keys as list[(tiles, key)] in order [left, right, up, down].
+        Keys are derived from the key of tiles without rehashing the whole state.
+        """
+        codes = self.codes(tiles)
+        split = len(codes) - self.ndestroyertiles
+        normal = codes[:split]
+        destroyers = codes[split:]
+        if self.symmetric:  # canonical keys can't be updated incrementally
+            moves = [self.__move(normal, destroyers, dir, None)[0] for dir in range(4)]
+            return [(newtiles, self.canonical_key(newtiles)) for newtiles in moves]
+        return [self.__move(normal, destroyers, dir, key) for dir in range(4)]  # must be consistent with self.DIRECTIONS!
+
+    def move(self, tiles: bytes, dir) -> bytes:
+        codes = self.codes(tiles)
+        split = len(codes) - self.ndestroyertiles
+        return self.__move(codes[:split], codes[split:], dir, None)[0]
+
+    def predecessors(self, tiles: bytes, dir: int):
+        """Yield all packed states, which are turned into tiles by a move into direction dir.
+        Only supported for maps without destroyer blocks and destroyer tiles (see has_destroyers()).
+
+        Tiles in a row along dir form a chain. A tile did not move, iff it is in front of a wall or of
+        a tile which did not move. So in each chain, which is in front of a wall, some front-most tiles
+        stayed (0 up to all), and the others moved from the position behind. In other chains all tiles moved.
+        """
+        ahead = self.neighbours[dir]
+        behind = self.neighbours[self.OPPOSITE[dir]]
+        codes = self.codes(tiles)
+        positions = {self.codepos[c]: c for c in codes}
+
+        options = []  # per chain: list of possible predecessor codes of the chain
+        for c in codes:
+            pos = self.codepos[c]
+            if behind[pos] in positions:
+                continue  # not the back of a chain
+            chain = [c]  # from back to front
+            while ahead[self.codepos[chain[-1]]] in positions:
+                chain.append(positions[ahead[self.codepos[chain[-1]]]])
+            maxstayed = len(chain) if ahead[self.codepos[chain[-1]]] < 0 else 0
+            chainoptions = []
+            for nstayed in range(maxstayed + 1):
+                nmoved = len(chain) - nstayed
+                if nmoved > 0 and behind[self.codepos[chain[0]]] < 0:
+                    continue  # back tile can't come from a wall
+                moved = [m + (behind[self.codepos[m]] - self.codepos[m])*self.NTYPES for m in chain[:nmoved]]
+                chainoptions.append(moved + chain[nmoved:])
+            if not chainoptions:
+                return
+            options.append(chainoptions)
+
+        for chains in itertools.product(*options):
+            yield array(self.codetype, sorted(itertools.chain(*chains))).tobytes()
+
+    def has_destroyers(self) -> bool:
+        """True, if destroyer blocks or destroyer tiles exist on map."""
+        return len(self.destroyers) > 0 or self.has_destroyer_tiles()
+
+    def __move(self, normal: array, destroyers: array, dir: int, key) -> tuple:
+        """Move normal and destroyer tiles (sorted codes) into direction dir, if possible.
+        Returns the packed state and its key (None if key is None).
+        """
+        zobrist = self.zobrist if (key is not None and self.keymode == 'zobrist') else None
+        if destroyers:
+            # destroyer tiles are only blocked by walls, destroyer blocks and each other
+            destroyers, key = self.__movelayer(destroyers, self.destroyersteps[dir], dir, key, zobrist)
+        normal, key = self.__movelayer(normal, self.steps[dir], dir, key, zobrist)
+
+        # let destroyer blocks and tiles destroy normal tiles
+        lethal = self.lethal
+        if destroyers:
+            codepos = self.codepos
+            killers = [codepos[c] for c in destroyers]
+            survivors = [c for c in normal if not (lethal[c] or codepos[c] in killers)]
+        else:
+            survivors = [c for c in normal if not lethal[c]]
+        if zobrist is not None and len(survivors) != len(normal):
+            for c in set(normal).difference(survivors):
+                key ^= zobrist[c]
+
+        tiles = array(self.codetype, survivors)
+        tiles.extend(destroyers)
+        tiles = tiles.tobytes()
+        if key is not None and zobrist is None:
+            key = tiles
+        return tiles, key
+
+    def __movelayer(self, codes: array, steps: array, dir: int, key, zobrist) -> tuple:
+        """Move tiles (sorted codes), which block each other, according to steps.
+        Returns the sorted moved codes and the updated key.
+        """
+        occupied = self.occupied  # all zero between calls
+        codepos = self.codepos
+        for c in codes:
+            occupied[codepos[c]] = 1
+        moved = []
+        for c in (reversed(codes) if self.BACKWARDS[dir] else codes):
+            newc = steps[c]
+            if newc >= 0 and not occupied[codepos[newc]]:
+                occupied[codepos[c]] = 0
+                occupied[codepos[newc]] = 1
+                if zobrist is not None:
+                    key ^= zobrist[c] ^ zobrist[newc]
+                c = newc
+            moved.append(c)
+        for c in moved:
+            occupied[codepos[c]] = 0
+        # horizontal moves keep the order (map borders are blocking), vertical moves may not
+        if dir >= 2:
+            moved.sort()
+        elif self.BACKWARDS[dir]:
+            moved.reverse()
+        return moved, key
 
     def load(self, filename) -> None:
-        """Loads a textfile as a map.
-        Sets 3 variables:
+        """Loads a textfile (or a .lvl file, see load_lvl()) as a map.
+        Sets 4 variables:
         self.obstacles: the positions of the obstacles as a set.
         self.destroyers: the positions of the destroyer blocks as a set.
-        self.start: the positions of the starting elements as a list, containing indistinguishable sets of tiles.
-        self.dest: the positions of the target points as a list, containing indistinguishable sets of tiles.
+        self.start: the packed state of the starting elements.
+        self.dest: the packed state of the target points.
         each position is an integer value counting row-first from top-left, i.e.
         pos=rownum*width + colnum
         """
+        if filename.endswith(".lvl"):
+            return self.load_lvl(filename)
         with open(filename, 'r') as file:
             textmap = file.read().splitlines()
-        self.height = len(textmap)
-        self.width = max(len(line) for line in textmap)
-        self.obstacles = TileList()
-        self.destroyers = TileList()
-        self.start = TileList()
-        self.dest = TileList()
+        height = len(textmap)
+        width = max(len(line) for line in textmap)
+        self.width = width  # needed by vec2pos
+        obstacles = TileList()
+        destroyers = TileList()
+        start = TileList()
+        dest = TileList()
 
         # parse textmap
         for h, line in enumerate(textmap):
             for w, char in enumerate(line):
                 pos = self.vec2pos([h, w])
                 if char == self.OBSTACLE_CHAR:
-                    self.obstacles.append(pos)
+                    obstacles.append(pos)
                 if char == self.DESTROYER_CHAR:
-                    self.destroyers.append(pos)
+                    destroyers.append(pos)
                 if char in self.START_CHARS:
-                    self.start.append(Tile(self.START_CHARS.index(char), pos))
+                    start.append(Tile(self.START_CHARS.index(char), pos))
                 if char in self.DEST_CHARS:
-                    self.dest.append(Tile(self.DEST_CHARS.index(char), pos))
+                    dest.append(Tile(self.DEST_CHARS.index(char), pos))
+
+        self.setup(width, height, obstacles, destroyers, start, dest)
+
+    def load_lvl(self, filename) -> None:
+        """Loads a .lvl file (JSON) as a map. Blocks are given by their [row, column]:
+        {"width": 5, "height": 3, "obstacles": [[0, 0], ...], "destroyers": [...],
+         "tiles": {"a": [[1, 1]], ...}, "targets": {"A": [[1, 3]], ...}}
+        Tiles and targets are keyed by their characters of the text format.
+        """
+        try:
+            with open(filename, 'r') as file:
+                level = json.load(file)
+            self.width = int(level['width'])
+            self.height = int(level['height'])
+            obstacles = TileList(self.vec2pos(vec) for vec in level['obstacles'])
+            destroyers = TileList(self.vec2pos(vec) for vec in level.get('destroyers', []))
+            start = TileList(Tile(self.START_CHARS.index(char), self.vec2pos(vec))
+                             for char, vecs in level['tiles'].items() for vec in vecs)
+            dest = TileList(Tile(self.DEST_CHARS.index(char), self.vec2pos(vec))
+                            for char, vecs in level['targets'].items() for vec in vecs)
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            print(f"ERROR: invalid .lvl file {filename}: {error!r}")
+            exit(10)
+        self.setup(self.width, self.height, obstacles, destroyers, start, dest)
+
+    def setup(self, width, height, obstacles, destroyers, start, dest) -> None:
+        """Set up the map from its blocks.
+        obstacles and destroyers are lists of positions, start and dest are lists of tiles.
+        """
+        self.width = width
+        self.height = height
 
         # make objects hashable
-        self.obstacles = self.obstacles.hashable()
-        self.destroyers = self.destroyers.hashable()
-        self.start = self.start.hashable()
-        self.dest = self.dest.hashable()
+        self.obstacles = TileList(obstacles).hashable()
+        self.destroyers = TileList(destroyers).hashable()
+
+        # codes have to fit into the array type of packed states
+        ncells = self.width*self.height
+        ncodes = ncells*self.NTYPES
+        self.codetype = 'H' if ncodes <= 2**16 else 'I'
+        self.codepos = [c // self.NTYPES for c in range(ncodes)]
+        self.lethal = bytearray(pos in self.destroyers for pos in self.codepos)
+        self.occupied = bytearray(ncells)  # scratch occupancy grid for moving
+        self.compile_moves()
+        if self.keymode == 'zobrist':
+            rng = random.Random(self.ZOBRIST_SEED)
+            self.zobrist = [rng.getrandbits(64) for _ in range(ncodes)]
+
+        self.start = self.pack(start)
+        self.dest = self.pack(dest)
+        self.compile_symmetries()
+        self.ndestroyertiles = len([t for t in start if t.is_destroyer()])
+        self.desttypesn = Counter(t.type for t in dest)
 
         error = self.check_for_errors()
         if error:
             print("ERROR: " + error)
             exit(10)
         
+        self.compile_regions()
+        self.compile_corridors()
+        self.unsolvable = self.find_deadlock()  # type: str or False
+        # tiles can't leave their region, so counting is only needed if they can vanish
+        self.count_tiles = any(self.vanishing)
+        self.count_regions = self.count_tiles and (
+            len(self.needs) > len(self.desttypesn)  # targets of one type in several regions
+            or any(self.regionneeds[c] < 0 for c in self.codes(self.start) if c % self.NTYPES in self.desttypesn))
+        # without vanishing tiles the order in a corridor never changes, so checking the start is enough
+        self.count_corridors = any(self.vanishing[self.regions[pos]] for pos, corridor in enumerate(self.corridors)
+                                   if corridor >= 0)
+        self.compile_checks()
+        self.compile_distances()
+
+    def compile_checks(self) -> None:
+        """Set node_has_no_future() and solved() for this map."""
         # default
         self.node_has_no_future = lambda tiles: not self.notzero_tiles(tiles)
-        if len(self.destroyers) > 0:
-            # always count tiles if destroyer block is present
+        if self.count_regions:
+            self.node_has_no_future = lambda tiles: (not self.notzero_tiles(tiles)) or (not self.enough_region_tiles(tiles))
+        elif self.count_tiles:
+            # always count tiles if they can vanish
             self.node_has_no_future = lambda tiles: (not self.notzero_tiles(tiles)) or (not self.enough_tiles(tiles))
-        
-        # default
-        self.destroy_tiles = self.destroy_tiles_onlyblocks
-        self.newpos_valid = lambda tile, newpos, tiles: not self.in_obstacle(newpos) and self.valid_with_othertiles(newpos, tiles)
+        if self.count_corridors:
+            check = self.node_has_no_future
+            self.node_has_no_future = lambda tiles: check(tiles) or (not self.tiles_in_order(tiles))
+
+        self.solved = lambda tiles: tiles == self.dest
         if self.has_destroyer_tiles():  # map has destroyer tiles
-            self.destroy_tiles = self.destroy_tiles_with_destroyertiles
-            self.newpos_valid = lambda tile, newpos, tiles: not self.in_obstacle(newpos) and self.valid_with_destroyertiles(tile, newpos, tiles)
+            # destroyer tiles always survive and are packed behind the normal tiles
+            destroyerbytes = self.ndestroyertiles * array(self.codetype).itemsize
+            self.solved = lambda tiles: tiles[:len(tiles)-destroyerbytes] == self.dest
+
+    def compile_moves(self) -> None:
+        """Compile neighbour tables of positions and move tables of tile codes.
+        Sets 3 variables:
+        self.neighbours: for each direction, the neighbouring position of each position (-1 if wall).
+        self.steps: for each direction, the code of a normal tile after moving (-1 if blocked by wall).
+        self.destroyersteps: same for destroyer tiles, which are also blocked by destroyer blocks.
+        """
+        ncells = self.width*self.height
+        offsets = [-1, 1, -self.width, self.width]  # must be consistent with self.DIRECTIONS!
+        self.neighbours = []
+        for offset in offsets:
+            neighbours = array('i', [-1]*ncells)
+            for pos in range(ncells):
+                newpos = pos + offset
+                if (pos not in self.obstacles) and (0 <= newpos < ncells) and (newpos not in self.obstacles):
+                    neighbours[pos] = newpos
+            self.neighbours.append(neighbours)
+
+        self.steps = []
+        self.destroyersteps = []
+        for neighbours in self.neighbours:
+            steps = array('i', [-1]*ncells*self.NTYPES)
+            destroyersteps = array('i', [-1]*ncells*self.NTYPES)
+            for code, pos in enumerate(self.codepos):
+                newpos = neighbours[pos]
+                if newpos < 0:
+                    continue
+                steps[code] = code + (newpos - pos)*self.NTYPES
+                if newpos not in self.destroyers:
+                    destroyersteps[code] = steps[code]
+            self.steps.append(steps)
+            self.destroyersteps.append(destroyersteps)
+
+    def compile_symmetries(self) -> None:
+        """Find the mirrorings and rotations of the map, which keep obstacles, destroyer blocks and targets in place.
+        Moves of mirrored states are mirrored moves, and the target is its own mirror image,
+        so a state and its mirror images are equally far from the target, and only one of them has to be searched.
+        Sets 3 variables:
+        self.codemaps: for each symmetry (identity first), the mirrored code of each tile code.
+        self.zobrists: for each symmetry, the Zobrist keys of the mirrored codes (zobrist keys only).
+        self.symmetric: True, if there are symmetries besides identity and self.symmetry is enabled.
+        """
+        h, w = self.height - 1, self.width - 1
+        transforms = [lambda y, x: (y, x), lambda y, x: (y, w-x), lambda y, x: (h-y, x), lambda y, x: (h-y, w-x)]
+        if self.width == self.height:  # rotations by 90 degrees and diagonal mirrorings
+            transforms += [lambda y, x: (x, y), lambda y, x: (w-x, h-y), lambda y, x: (x, h-y), lambda y, x: (w-x, y)]
+        dest = set(self.unpack(self.dest))
+        self.codemaps = []
+        for transform in transforms:
+            posmap = [self.vec2pos(transform(*self.pos2vec(pos))) for pos in range(self.width*self.height)]
+            if (set(posmap[pos] for pos in self.obstacles) != set(self.obstacles)
+                    or set(posmap[pos] for pos in self.destroyers) != set(self.destroyers)
+                    or set(Tile(t.type, posmap[t.pos]) for t in dest) != dest):
+                continue
+            self.codemaps.append(array('i', [posmap[pos]*self.NTYPES + c % self.NTYPES for c, pos in enumerate(self.codepos)]))
+        if self.keymode == 'zobrist':
+            self.zobrists = [[self.zobrist[c] for c in codemap] for codemap in self.codemaps]
+        self.symmetric = self.symmetry and len(self.codemaps) > 1
+
+    def compile_regions(self) -> None:
+        """Compile the regions of the map, i.e. connected areas of free positions.
+        A tile only moves to neighbouring positions (or vanishes in a destroyer block), so it never leaves its region.
+        Sets 4 variables:
+        self.regions: for each position, the index of its region (-1 for obstacles and destroyer blocks).
+        self.vanishing: for each region, True if tiles can vanish in it (next to a destroyer block, or with a destroyer tile).
+        self.needs: the number of targets of each (region, type) which has targets.
+        self.regionneeds: for each tile code, the index of its (region, type) in self.needs (-1 if there are no targets).
+        """
+        ncells = self.width*self.height
+        passable = [(pos not in self.obstacles) and (pos not in self.destroyers) for pos in range(ncells)]
+        self.regions = array('i', [-1]*ncells)
+        self.vanishing = []
+        for pos in range(ncells):
+            if not passable[pos] or self.regions[pos] >= 0:
+                continue
+            region = len(self.vanishing)
+            vanishing = False
+            for newpos, distance in enumerate(self.distances([pos], passable)):
+                if distance != self.UNREACHABLE:
+                    self.regions[newpos] = region
+                    vanishing = vanishing or any(neighbours[newpos] in self.destroyers for neighbours in self.neighbours)
+            self.vanishing.append(vanishing)
+        for code in self.codes(self.start):
+            if code % self.NTYPES == self.DESTROYER_TYPE:
+                self.vanishing[self.regions[self.codepos[code]]] = True
+
+        needs = Counter((self.regions[t.pos], t.type) for t in self.unpack(self.dest))
+        slots = list(needs)
+        self.needs = array('i', [needs[slot] for slot in slots])
+        self.regionneeds = array('i', [-1]*len(self.codepos))
+        for code, pos in enumerate(self.codepos):
+            if (self.regions[pos], code % self.NTYPES) in needs:
+                self.regionneeds[code] = slots.index((self.regions[pos], code % self.NTYPES))
+
+    def compile_corridors(self) -> None:
+        """Compile the corridors of the map, i.e. regions which are a path of width 1 (see compile_regions()).
+        All tiles move into the same direction and by one position at most, so tiles in a corridor can't pass
+        each other, and the order of their types along the corridor never changes (except for vanished tiles).
+        Only corridors with targets of at least two types are kept, as the order of one type is always right.
+        Sets 3 variables:
+        self.corridors: for each position, the index of its corridor (-1 if it is not in a kept corridor).
+        self.corridorrank: for each position in a corridor, its index along the corridor.
+        self.corridortargets: for each corridor, the types of its targets along the corridor.
+        """
+        ncells = self.width*self.height
+        passable = [(pos not in self.obstacles) and (pos not in self.destroyers) for pos in range(ncells)]
+        paths = {}  # type: dict[int, list[int]]  # region: positions along it
+        degrees = [[newpos for newpos in (neighbours[pos] for neighbours in self.neighbours) if newpos >= 0 and passable[newpos]]
+                   for pos in range(ncells)]
+        wide = set(self.regions[pos] for pos in range(ncells) if passable[pos] and len(degrees[pos]) > 2)
+        for pos in range(ncells):
+            region = self.regions[pos]
+            if passable[pos] and len(degrees[pos]) <= 1 and region not in wide and region not in paths:
+                path = [pos]  # walk from one end to the other
+                while len(path) == 1 or len(degrees[path[-1]]) == 2:
+                    following = [newpos for newpos in degrees[path[-1]] if len(path) == 1 or newpos != path[-2]]
+                    if not following:
+                        break
+                    path.append(following[0])
+                paths[region] = path  # rings have no end and are skipped
+
+        targets = {t.pos: t.type for t in self.unpack(self.dest)}
+        self.corridors = array('i', [-1]*ncells)
+        self.corridorrank = array('i', [-1]*ncells)
+        self.corridortargets = []
+        for path in paths.values():
+            types = [targets[pos] for pos in path if pos in targets]
+            if len(set(types)) < 2:
+                continue
+            for rank, pos in enumerate(path):
+                self.corridors[pos] = len(self.corridortargets)
+                self.corridorrank[pos] = rank
+            self.corridortargets.append(types)
+
+    def tiles_in_order(self, tiles: bytes) -> bool:
+        """True, if the targets of each corridor can still be reached in their order (see compile_corridors())."""
+        return self.misordered_corridor(tiles) < 0
+
+    def misordered_corridor(self, tiles: bytes) -> int:
+        """Index of the first corridor whose target types are no subsequence of the types of its tiles
+        (in the order along the corridor), or -1 if there is none."""
+        found = [[] for _ in self.corridortargets]
+        corridors = self.corridors
+        codepos = self.codepos
+        for c in self.codes(tiles):
+            corridor = corridors[codepos[c]]
+            if corridor >= 0 and c % self.NTYPES != self.DESTROYER_TYPE:
+                found[corridor].append((self.corridorrank[codepos[c]], c % self.NTYPES))
+        for corridor, (targets, ranked) in enumerate(zip(self.corridortargets, found)):
+            types = iter([typ for _, typ in sorted(ranked)])
+            if not all(typ in types for typ in targets):  # consumes types up to each match
+                return corridor
+        return -1
+
+    def find_deadlock(self) -> str or False:
+        """Returns the reason why the map can't be solved, if it is obvious from the regions (see compile_regions()), else False.
+        Every tile has to reach a target of its type in its region or vanish, every region needs
+        enough tiles of each type for its targets, and every corridor its tiles in the order of its targets
+        (see compile_corridors()).
+        """
+        counts = Counter()
+        for tile in self.unpack(self.start):
+            if tile.is_destroyer():
+                continue
+            region = self.regions[tile.pos]
+            counts[(region, tile.type)] += 1
+            if self.regionneeds[self.code(tile)] < 0 and not self.vanishing[region]:
+                return f"Tile {self.START_CHARS[tile.type]} at {self.pos2vec(tile.pos)} can neither reach a target nor vanish"
+        for target in self.unpack(self.dest):
+            slot = (self.regions[target.pos], target.type)
+            need = self.needs[self.regionneeds[self.code(target)]]
+            if counts[slot] < need:
+                return f"Not enough tiles can reach targets {self.DEST_CHARS[target.type]} around {self.pos2vec(target.pos)}"
+            if counts[slot] > need and not self.vanishing[slot[0]]:
+                return f"Too many tiles {self.START_CHARS[target.type]} around {self.pos2vec(target.pos)}, which can't vanish"
+        corridor = self.misordered_corridor(self.start)
+        if corridor >= 0:
+            end = self.corridors.index(corridor)
+            return f"Tiles in the corridor at {self.pos2vec(end)} can't pass each other to reach their targets in order"
+        return False
+
+    def compile_distances(self) -> None:
+        """Compile lower bounds of the number of moves each tile needs to reach its target.
+        A single tile on an empty map moves one step per move, and vanishes in destroyer blocks.
+        Sets 2 variables:
+        self.tilebounds: for each tile code, the number of moves to reach the nearest target of its type
+            (or to vanish in a destroyer, if that is shorter).
+        self.targetbounds: for each target, the number of moves of each tile code to reach it
+            (UNREACHABLE for tiles of other types).
+        """
+        ncells = self.width*self.height
+        passable = [(pos not in self.obstacles) and (pos not in self.destroyers) for pos in range(ncells)]
+        vanish = self.distances(self.destroyers, passable)  # moving into the destroyer is the last step
+        if self.has_destroyer_tiles():
+            vanish = array('H', [0]*ncells)  # destroyer tiles could destroy tiles anywhere
+
+        dest = self.unpack(self.dest)
+        bytype = {typ: self.distances([t.pos for t in dest if t.type == typ], passable) for typ in self.desttypesn}
+        self.tilebounds = array('H', [0]*len(self.codepos))
+        for code in range(len(self.codepos)):
+            tile = self.tile(code)
+            if tile.type in bytype:
+                self.tilebounds[code] = min(bytype[tile.type][tile.pos], vanish[tile.pos])
+            elif not tile.is_destroyer():
+                self.tilebounds[code] = vanish[tile.pos]
+
+        self.targetbounds = []
+        for target in dest:
+            distances = self.distances([target.pos], passable)
+            bounds = array('H', [self.UNREACHABLE]*len(self.codepos))
+            for pos in range(ncells):
+                bounds[pos*self.NTYPES + target.type] = distances[pos]
+            self.targetbounds.append(bounds)
+
+    def distances(self, sources, passable: list[bool]) -> array:
+        """Number of moves a single tile needs from each position to any of the sources,
+        moving through passable positions only (breadth-first search)."""
+        distances = array('H', [self.UNREACHABLE]*self.width*self.height)
+        leaves = list(sources)
+        for pos in leaves:
+            distances[pos] = 0
+        while leaves:
+            newleaves = []
+            for pos in leaves:
+                for neighbours in self.neighbours:  # neighbourhood is symmetric
+                    newpos = neighbours[pos]
+                    if newpos >= 0 and passable[newpos] and distances[newpos] == self.UNREACHABLE:
+                        distances[newpos] = distances[pos] + 1
+                        newleaves.append(newpos)
+            leaves = newleaves
+        return distances
+
+    def lower_bound(self, tiles: bytes) -> int:
+        """Admissible lower bound of the number of moves from tiles to the target (UNREACHABLE if impossible).
+        Every tile has to reach a target or vanish, and every target has to be reached by a tile of its type.
+        Since each move moves a tile at most one step, the maximum of these bounds is admissible.
+        """
+        codes = self.codes(tiles)
+        tilebounds = self.tilebounds
+        bound = max([tilebounds[c] for c in codes], default=0)
+        for bounds in self.targetbounds:
+            bound = max(bound, min([bounds[c] for c in codes], default=self.UNREACHABLE))
+        return bound
+
+    def solved(self, tiles: bytes) -> bool:
+        """True, if the game tiles (without destroyer tiles) are in target position."""
+        pass  # set in setup()
 
     def has_destroyer_tiles(self) -> bool:
         """True, if destroyer tiles exist on map."""
-        return len([t for t in self.start if t.is_destroyer()]) > 0
+        return self.ndestroyertiles > 0
 
     def check_for_errors(self) -> str or False:
         """Returns error string if map blocks are invalid, else False."""
@@ -293,8 +690,8 @@ class IntMap(Map):
         if len(self.start) == 0:
             return "No starting blocks in map"
         
-        starttypes = set([st.type for st in self.start])
-        desttypes = set([dt.type for dt in self.dest])
+        starttypes = set([st.type for st in self.unpack(self.start)])
+        desttypes = set([dt.type for dt in self.unpack(self.dest)])
         for typ in desttypes:
             if typ not in starttypes:
                 return "No corresponding starting tile for target tile " + self.DEST_CHARS[typ]
@@ -303,11 +700,12 @@ class IntMap(Map):
         if not self.enough_tiles(self.start):
             return "Did not find enough starting tiles for all target tiles."
 
-        for h in range(self.height):
-            for w in range(self.width):
-                pos = self.vec2pos([h, w])
-                if self.isborder(pos) and (pos not in self.obstacles) and (pos not in self.destroyers):
-                    return "Map is not surrounded by obstacle or destroyer blocks"
+        lastrow = (self.height-1)*self.width
+        border = itertools.chain(range(self.width), range(lastrow, lastrow + self.width),
+                                 range(0, lastrow, self.width), range(self.width-1, lastrow, self.width))
+        walls = self.obstacles | self.destroyers
+        if not all(pos in walls for pos in border):
+            return "Map is not surrounded by obstacle or destroyer blocks"
         
         return False
     
@@ -330,20 +728,29 @@ class IntMap(Map):
         w = vec[1]
         return h*self.width + w
 
-    def enough_tiles(self, tiles):
-        """True, if set of tiles are enough for target (types must also match)."""
+    def enough_tiles(self, tiles: bytes):
+        """True, if packed state has enough tiles for target (types must also match)."""
         if len(tiles) < len(self.dest):
             return False
-        desttypes = [tile.type for tile in self.dest]
-        desttypesn = Counter(desttypes)
-        types = [tile.type for tile in tiles]
-        typesn = Counter(types)
+        desttypesn = self.desttypesn
+        ntypes = self.NTYPES
+        typesn = Counter(c % ntypes for c in self.codes(tiles))
         for typ in desttypesn.keys():
             if typesn[typ] < desttypesn[typ]:
                 return False
         return True
     
-    def notzero_tiles(self, tiles):
+    def enough_region_tiles(self, tiles: bytes):
+        """True, if each region has enough tiles for its targets (types must also match, see compile_regions())."""
+        counts = [0]*len(self.needs)
+        regionneeds = self.regionneeds
+        for c in self.codes(tiles):
+            slot = regionneeds[c]
+            if slot >= 0:
+                counts[slot] += 1
+        return all(n >= need for n, need in zip(counts, self.needs))
+
+    def notzero_tiles(self, tiles: bytes):
         return len(tiles) != 0
 
     def node_has_no_future(self, tiles):
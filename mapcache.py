@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import zipfile
+from array import array
+from collections import Counter
+import numpy as np
+
+
+class MapCache:
+    """Compiled maps (the tables of IntMap.setup()) on disk, so repeated runs don't compile them again.
+
+    Each map is stored as <hash>.npz in the directory, where hash is the SHA-256 of the content of the
+    map file, the settings of the IntMap (key mode and symmetry) and VERSION.
+    VERSION has to be increased whenever the compiled tables change.
+    """
+    VERSION = 2
+    ARRAYS = {  # attribute: dtype of tables which are arrays (or lists of arrays) of integers
+        'lethal': np.uint8, 'neighbours': np.int32, 'steps': np.int32, 'destroyersteps': np.int32,
+        'codemaps': np.int32, 'regions': np.int32, 'needs': np.int32, 'regionneeds': np.int32,
+        'corridors': np.int32, 'corridorrank': np.int32,
+        'tilebounds': np.uint16, 'targetbounds': np.uint16,
+    }
+    LISTS = ['neighbours', 'steps', 'destroyersteps', 'codemaps', 'targetbounds']  # lists of arrays
+    TYPECODES = {np.uint8: 'B', np.int32: 'i', np.uint16: 'H'}
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, filename: str, keymode: str, symmetry: bool) -> str:
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as file:
+            digest.update(file.read())
+        digest.update(f"{keymode} {symmetry} {self.VERSION}".encode())
+        return os.path.join(self.directory, digest.hexdigest() + ".npz")
+
+    def load(self, mp, filename: str) -> None:
+        """Set up IntMap mp from its compiled file, or load the map file and store its compiled tables."""
+        path = self.path(filename, mp.keymode, mp.symmetry)
+        if os.path.exists(path):
+            try:
+                self.restore(mp, path)
+                return
+            except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):  # damaged file, compile again
+                pass
+        mp.load(filename)
+        self.store(mp, path)
+
+    def store(self, mp, path: str) -> None:
+        meta = {'width': mp.width, 'height': mp.height, 'codetype': mp.codetype, 'ndestroyertiles': mp.ndestroyertiles,
+                'symmetric': mp.symmetric, 'unsolvable': mp.unsolvable, 'vanishing': list(mp.vanishing),
+                'count_tiles': mp.count_tiles, 'count_regions': mp.count_regions,
+                'corridortargets': mp.corridortargets, 'count_corridors': mp.count_corridors}
+        arrays = {name: np.array(getattr(mp, name), dtype=dtype) for name, dtype in self.ARRAYS.items()}
+        arrays['obstacles'] = np.array(sorted(mp.obstacles), dtype=np.int32)
+        arrays['destroyers'] = np.array(sorted(mp.destroyers), dtype=np.int32)
+        arrays['start'] = np.frombuffer(mp.start, dtype=np.uint8)
+        arrays['dest'] = np.frombuffer(mp.dest, dtype=np.uint8)
+        if mp.keymode == 'zobrist':
+            arrays['zobrist'] = np.array(mp.zobrist, dtype=np.uint64)
+        temporary = f"{path}.{os.getpid()}.tmp"  # other processes might store the same map
+        with open(temporary, 'wb') as file:
+            np.savez(file, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(temporary, path)
+
+    def restore(self, mp, path: str) -> None:
+        with np.load(path) as arrays:
+            meta = json.loads(str(arrays['meta']))
+            for name, dtype in self.ARRAYS.items():
+                values = arrays[name]
+                typecode = self.TYPECODES[dtype]
+                if name in self.LISTS:
+                    setattr(mp, name, [array(typecode, row.tobytes()) for row in values])
+                elif name == 'lethal':
+                    mp.lethal = bytearray(values.tobytes())
+                else:
+                    setattr(mp, name, array(typecode, values.tobytes()))
+            mp.obstacles = frozenset(arrays['obstacles'].tolist())
+            mp.destroyers = frozenset(arrays['destroyers'].tolist())
+            mp.start = arrays['start'].tobytes()
+            mp.dest = arrays['dest'].tobytes()
+            if mp.keymode == 'zobrist':
+                zobrist = arrays['zobrist']
+                mp.zobrist = zobrist.tolist()
+                mp.zobrists = [zobrist[codemap].tolist() for codemap in arrays['codemaps']]
+        for name, value in meta.items():
+            setattr(mp, name, value)
+        ncodes = mp.width*mp.height*mp.NTYPES
+        mp.codepos = (np.arange(ncodes) // mp.NTYPES).tolist()
+        mp.occupied = bytearray(mp.width*mp.height)
+        mp.desttypesn = Counter(c % mp.NTYPES for c in mp.codes(mp.dest))
+        mp.compile_checks()
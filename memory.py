@@ -0,0 +1,30 @@
+import os
+import sys
+import resource
+
+UNITS = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+
+
+def parse_size(text: str) -> int:
+    """Parse a memory size like 512M or 4G (binary units) to bytes."""
+    text = text.strip().upper().removesuffix('B')
+    unit = text[-1:] if text[-1:] in UNITS else ''
+    try:
+        return int(float(text[:len(text)-len(unit)]) * UNITS[unit])
+    except ValueError:
+        raise ValueError(f"invalid memory size: {text}")
+
+
+def rss() -> int:
+    """Current resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss()  # no procfs
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024  # kilobytes on Linux
@@ -1,13 +1,15 @@
-from map import TileList
+from array import array
+
 
 class Node():
-    def __init__(self, tiles: TileList.hashabletype, parent = None, parent_edge = None):
-        self.tiles = tiles  # type: TileList.hashabletype
+    def __init__(self, tiles: bytes, key = None, parent = None, parent_edge = None):
+        self.tiles = tiles  # type: bytes  # packed state, see IntMap
+        self.key = key  # key of tiles in the seen set, see IntMap.key()
         self.parent = parent  # type: Node or None  # None ==> Node is root
         self.parent_edge = parent_edge  # type: int or None  # one of [None, 0, 1, 2, 3]
     
-    def get_tiles(self) -> TileList.hashabletype:
-        """Return game tiles."""
+    def get_tiles(self) -> bytes:
+        """Return packed game tiles."""
         return self.tiles
 
     def is_root(self) -> bool:
@@ -15,13 +17,64 @@ class Node():
 
     def getrootpath(self) -> list[int]:
         """Returns path from root to node as list."""
-        if self.parent.is_root():
-            return [self.parent_edge]
-        return self.parent.getrootpath() + [self.parent_edge]
+        path = []
+        node = self
+        while node.parent is not None:
+            path.append(node.parent_edge)
+            node = node.parent
+        return node.treepath() + path[::-1]
+
+    def treepath(self) -> list[int]:
+        """Returns path from root to node, which is not stored in parent references."""
+        return []
+
+
+class IndexedNode(Node):
+    """Node of a tree which is stored as arrays per tree level.
+    levels[i] is a tuple (parent indices, edges) of all nodes of tree level i+1,
+    index is the position of this node in the last level.
+    """
+    def __init__(self, tiles: bytes, key, levels: list[tuple], index: int):
+        super().__init__(tiles, key)
+        self.levels = levels
+        self.index = index
+
+    def is_root(self) -> bool:
+        return len(self.levels) == 0
+
+    def treepath(self) -> list[int]:
+        """Returns path from root to node by walking the level arrays backwards."""
+        path = []
+        index = self.index
+        for parents, edges in reversed(self.levels):
+            path.append(int(edges[index]))
+            index = parents[index]
+        return path[::-1]
+
+
+class StateList:
+    """Packed states (and their keys) of one tree level, stored in one buffer instead of one object per state.
+    In exact key mode, the key of a state is the state itself (see IntMap.key()).
+    """
+    def __init__(self, keymode: str):
+        self.data = bytearray()
+        self.ends = array('Q')  # end of each state in data
+        self.keys = array('Q') if keymode == 'zobrist' else None
+
+    def __len__(self) -> int:
+        return len(self.ends)
 
+    def append(self, tiles: bytes, key) -> None:
+        self.data += tiles
+        self.ends.append(len(self.data))
+        if self.keys is not None:
+            self.keys.append(key)
 
-class NodeWithDestroyerTileSupport(Node):
-    """Node which supports destroyer tiles."""
-    def get_tiles(self) -> TileList.hashabletype:
-        """Return game tiles (no destroyer tiles)."""
-        return TileList(filter(lambda t: not t.is_destroyer(), self.tiles)).hashable()
+    def __iter__(self):
+        """Iterate over (tiles, key)."""
+        data = memoryview(self.data)
+        start = 0
+        for i, end in enumerate(self.ends):
+            tiles = data[start:end].tobytes()
+            yield tiles, (self.keys[i] if self.keys is not None else tiles)
+            start = end
@@ -0,0 +1,271 @@
+import multiprocessing
+import queue
+import zlib
+from array import array
+from map import IntMap
+from memory import rss
+
+
+def owner(key, nshards: int) -> int:
+    """Shard which owns a key (see IntMap.key()).
+    Must not depend on the randomized hash() of bytes, because every worker is a separate process."""
+    if type(key) == int:
+        return key % nshards
+    return zlib.crc32(key) % nshards
+
+
+class ShardedSearch:
+    """Breadth-first search, which partitions each tree level across worker processes.
+
+    Each worker owns the constellations whose key maps to it (see owner()), i.e. its
+    slice of the seen set and of each tree level. Per level, every worker expands
+    its own leaves and sends the new constellations to their owners, which drop
+    duplicates. Nodes are referenced by (index in level of shard)*nshards + shard.
+    """
+    POLLTIME = 0.1  # seconds between checks (see expand())
+
+    def __init__(self, filename: str, keymode: str, symmetry: bool, nworkers: int, cachedir: str = None):
+        self.nworkers = nworkers
+        self.pending = False  # True while workers are busy with a message (see close())
+        ctx = multiprocessing.get_context()
+        queues = [ctx.Queue() for _ in range(nworkers)]
+        self.conns = []
+        self.processes = []
+        for shard in range(nworkers):
+            conn, childconn = ctx.Pipe()
+            process = ctx.Process(target=ShardWorker(filename, keymode, symmetry, shard, nworkers, queues, cachedir).run,
+                                  args=(childconn,), daemon=True)
+            process.start()
+            self.conns.append(conn)
+            self.processes.append(process)
+
+    def __call(self, *message, check=None) -> list:
+        """Send message to all workers and return their answers.
+        While waiting, check() is called every POLLTIME seconds (if given), which may raise to stop waiting."""
+        for conn in self.conns:
+            conn.send(message)
+        self.pending = True
+        answers = []
+        for conn in self.conns:
+            while check is not None and not conn.poll(self.POLLTIME):
+                check()
+            answers.append(conn.recv())
+        self.pending = False
+        return answers
+
+    def start(self, leaves: list[tuple]) -> None:
+        """Set root level (list of (tiles, key))."""
+        shards = [[] for _ in range(self.nworkers)]
+        for tiles, key in leaves:
+            shards[owner(key, self.nworkers)].append((tiles, key))
+        for conn, shard in zip(self.conns, shards):
+            conn.send(("start", shard))
+        for conn in self.conns:
+            conn.recv()
+
+    def expand(self, check=None) -> tuple:
+        """Build next tree level.
+        check() is called regularly while the workers expand (see __call()), it may raise to stop them.
+
+        ## Returns
+        tuple (number of new leaves, solution, memory), where solution is (parent reference, edge) of a
+        solved constellation in the new level, or None, and memory is the resident set size of all processes.
+        """
+        answers = self.__call("expand", check=check)
+        solutions = [solution for _, solution, _ in answers if solution is not None]
+        return (sum(n for n, _, _ in answers), (solutions[0] if solutions else None),
+                rss() + sum(used for _, _, used in answers))
+
+    def rss(self) -> int:
+        """Resident set size of all processes in bytes."""
+        return rss() + sum(self.__call("rss"))
+
+    def gather(self) -> tuple:
+        """Collect the tree from all workers.
+
+        ## Returns
+        tuple (levels, leaves, seen, offsets):
+        - levels: list of (parent indices, edges) per level with global indices (see IndexedNode).
+        - leaves: list of (tiles, key) of the last level, in global order.
+        - seen: set of all seen keys.
+        - offsets: per level, the global index of the first node of each shard (see globalindex()).
+        """
+        answers = self.__call("gather")  # type: list[tuple]  # (levels, sizes, leaves, seen) per shard
+        nlevels = len(answers[0][0])
+        offsets = []
+        for level in range(nlevels + 1):
+            sizes = [answer[1][level] for answer in answers]
+            offsets.append([sum(sizes[:shard]) for shard in range(self.nworkers)])
+        levels = []
+        for level in range(nlevels):
+            parents = array('I')
+            edges = array('B')
+            for answer in answers:
+                refs, shardedges = answer[0][level]
+                parents.extend(self.globalindex(offsets, level, ref) for ref in refs)
+                edges.extend(shardedges)
+            levels.append((parents, edges))
+        leaves = [leaf for answer in answers for leaf in answer[2]]
+        seen = set()
+        for answer in answers:
+            seen.update(answer[3])
+        return levels, leaves, seen, offsets
+
+    def globalindex(self, offsets: list, level: int, ref: int) -> int:
+        """Convert a node reference of given level to its index in the gathered level."""
+        return offsets[level][ref % self.nworkers] + ref // self.nworkers
+
+    def close(self) -> None:
+        for conn, process in zip(self.conns, self.processes):
+            if self.pending:  # stopped early
+                process.kill()
+            else:
+                conn.send(("stop",))
+        for process in self.processes:
+            process.join()
+
+
+class ShardWorker:
+    """Worker process of ShardedSearch."""
+    def __init__(self, filename: str, keymode: str, symmetry: bool, shard: int, nshards: int, queues: list,
+                 cachedir: str = None):
+        self.filename = filename
+        self.cachedir = cachedir
+        self.keymode = keymode
+        self.symmetry = symmetry
+        self.shard = shard
+        self.nshards = nshards
+        self.queues = queues
+
+    def run(self, conn) -> None:
+        self.map = IntMap(self.filename, keymode=self.keymode, symmetry=self.symmetry, cachedir=self.cachedir)
+        self.seen = set()
+        self.levels = []  # type: list[tuple[array, array]]  # (parent references, edges) of own nodes per level
+        self.sizes = []  # type: list[int]  # number of own nodes per level
+        self.leaves = []  # type: list[tuple]  # (tiles, key) of own nodes in last level
+        while True:
+            message = conn.recv()
+            if message[0] == "start":
+                self.leaves = message[1]
+                self.sizes.append(len(self.leaves))
+                self.seen.update(key for _, key in self.leaves)
+                conn.send(None)
+            elif message[0] == "expand":
+                conn.send(self.expand())
+            elif message[0] == "rss":
+                conn.send(rss())
+            elif message[0] == "gather":
+                conn.send((self.levels, self.sizes, self.leaves, self.seen))
+            elif message[0] == "stop":
+                return
+
+    def expand(self) -> tuple:
+        """Expand own leaves, exchange new constellations with the other workers and keep the unseen ones."""
+        buckets = [[] for _ in range(self.nshards)]  # (tiles, key, parent reference, edge) per owner
+        solution = None
+        for i, (tiles, key) in enumerate(self.leaves):
+            ref = i*self.nshards + self.shard
+            for dir_i, (newtiles, newkey) in enumerate(self.map.keyed_moves(tiles, key)):
+                if self.map.node_has_no_future(newtiles):
+                    continue
+                if solution is None and self.map.solved(newtiles):
+                    solution = (ref, dir_i)
+                buckets[owner(newkey, self.nshards)].append((newtiles, newkey, ref, dir_i))
+
+        for shard, bucket in enumerate(buckets):
+            if shard != self.shard:
+                self.queues[shard].put((self.shard, bucket))
+        incoming = [None]*self.nshards
+        incoming[self.shard] = buckets[self.shard]
+        for _ in range(self.nshards - 1):
+            shard, bucket = self.queues[self.shard].get()
+            incoming[shard] = bucket
+
+        leaves = []
+        parents = array('Q')
+        edges = array('B')
+        for bucket in incoming:  # same order in every run
+            for newtiles, newkey, ref, dir_i in bucket:
+                if newkey not in self.seen:
+                    self.seen.add(newkey)
+                    leaves.append((newtiles, newkey))
+                    parents.append(ref)
+                    edges.append(dir_i)
+        self.leaves = leaves
+        self.sizes.append(len(leaves))
+        self.levels.append((parents, edges))
+        return len(leaves), solution, rss()
+
+
+class SharedBound:
+    """Maximum additional path length of forgetful iteration, shared by processes.
+    Reading it needs no lock, it is only written by tighten()."""
+    def __init__(self, ctx, value: int):
+        self.shared = ctx.RawValue('i', value)
+        self.lock = ctx.Lock()
+
+    @property
+    def value(self) -> int:
+        return self.shared.value
+
+    def tighten(self, value: int) -> None:
+        """Lower the bound to value (if it is lower)."""
+        with self.lock:
+            if value < self.shared.value:
+                self.shared.value = value
+
+
+class ForgetfulPool:
+    """Forgetful iteration on worker processes.
+
+    Leaves are handed out from a work queue in the order they are submitted, so the most promising
+    ones are searched first. The maximum additional path length is shared (see SharedBound): as soon
+    as a worker finds a solution, all workers only search for shorter ones.
+    Workers are forked, so they share the memorized tree with the main process instead of copying it.
+    """
+    def __init__(self, search, nworkers: int, maxlength: int):
+        """
+        ## Parameters:
+        search: function(tiles, key, bound) searching a leaf in a worker, returning a picklable tuple.
+        nworkers: (int) number of worker processes.
+        maxlength: (int) initial bound.
+        """
+        ctx = multiprocessing.get_context('fork')
+        self.bound = SharedBound(ctx, maxlength)
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        self.pending = 0  # number of submitted leaves without result
+        self.processes = [ctx.Process(target=self.work, args=(search,), daemon=True) for _ in range(nworkers)]
+        for process in self.processes:
+            process.start()
+
+    def work(self, search) -> None:
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            i, tiles, key = task
+            self.results.put((i,) + search(tiles, key, self.bound))
+
+    def submit(self, i: int, tiles: bytes, key) -> None:
+        """Queue leaf number i."""
+        self.tasks.put((i, tiles, key))
+        self.pending += 1
+
+    def result(self, timeout: float = None) -> tuple or None:
+        """Wait for the next finished leaf: (i,) + result of search, or None after timeout seconds."""
+        try:
+            finished = self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self.pending -= 1
+        return finished
+
+    def close(self) -> None:
+        for process in self.processes:
+            if self.pending:  # stopped early
+                process.kill()
+            else:
+                self.tasks.put(None)
+        for process in self.processes:
+            process.join()
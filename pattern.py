@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import zipfile
+from collections import Counter
+import numpy as np
+from map import IntMap
+
+
+class PatternDatabase:
+    """Lower bounds of the number of moves from pairs of tiles of the same type (pattern database).
+
+    The table of a type holds the exact number of moves of an abstracted map, on which only two tiles of
+    that type exist, and which is solved when both are on different targets of their type or vanished.
+    Other tiles could block them, so in each move each of the two tiles may move or stay (but not
+    both be at the same position). Every move of the real map is a move of the abstracted map, so the
+    table is a lower bound for every pair of tiles of that type in a state, and so is the maximum of
+    all pairs and IntMap.lower_bound().
+
+    Tables are built by backward breadth-first search from the solved pairs, and stored in cachedir
+    (if given), as they only depend on the blocks and targets of the map, not on the start.
+    Maps with destroyer tiles get no tables, as tiles can vanish anywhere there.
+    """
+    VERSION = 1
+    MAXCELLS = 2**10  # maps with more positions get no tables ((positions+1)^2 bytes each)
+    UNKNOWN = 255  # cost of pairs which can't be solved (costs are capped below)
+
+    def __init__(self, mp: IntMap, cachedir: str = None):
+        self.map = mp
+        self.ncells = mp.width*mp.height
+        self.gone = self.ncells  # position of vanished tiles
+        self.stride = self.ncells + 1  # pair (a, b) is at a*stride + b
+        counts = Counter(c % mp.NTYPES for c in mp.codes(mp.start))
+        types = [typ for typ in sorted(mp.desttypesn) if counts[typ] >= 2]
+        if mp.has_destroyer_tiles() or self.ncells > self.MAXCELLS:
+            types = []
+        self.tables = {}  # type: dict[int, bytes]  # type: costs of pairs
+
+        path = self.path(cachedir, types) if cachedir is not None and types else None
+        if path is not None and os.path.exists(path):
+            try:
+                with np.load(path) as arrays:
+                    self.tables = {typ: arrays[str(typ)].tobytes() for typ in types}
+                return
+            except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):  # damaged file, build again
+                pass
+        for typ in types:
+            self.tables[typ] = self.build(typ)
+        if path is not None:
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, 'wb') as file:
+                np.savez(file, **{str(typ): np.frombuffer(table, dtype=np.uint8) for typ, table in self.tables.items()})
+            os.replace(temporary, path)
+
+    def path(self, cachedir: str, types: list[int]) -> str:
+        """File of the tables in cachedir, named by a hash of everything they depend on."""
+        mp = self.map
+        content = [self.VERSION, mp.width, mp.height, sorted(mp.obstacles), sorted(mp.destroyers),
+                   list(mp.codes(mp.dest)), types]
+        os.makedirs(cachedir, exist_ok=True)
+        return os.path.join(cachedir, hashlib.sha256(json.dumps(content).encode()).hexdigest() + ".patterns.npz")
+
+    def predecessors(self) -> list[list[list[int]]]:
+        """For each direction and position (or self.gone), the positions a single tile could have come from."""
+        mp = self.map
+        passable = [(pos not in mp.obstacles) and (pos not in mp.destroyers) for pos in range(self.ncells)]
+        result = []
+        for dir, ahead in enumerate(mp.neighbours):
+            behind = mp.neighbours[mp.OPPOSITE[dir]]
+            before = []
+            for pos in range(self.ncells):
+                options = []
+                if passable[pos]:
+                    if ahead[pos] not in mp.destroyers:  # tiles always move into destroyer blocks
+                        options.append(pos)
+                    if behind[pos] >= 0 and passable[behind[pos]]:
+                        options.append(behind[pos])
+                before.append(options)
+            before.append([self.gone] + [pos for pos in range(self.ncells) if passable[pos] and ahead[pos] in mp.destroyers])
+            result.append(before)
+        return result
+
+    def build(self, typ: int) -> bytes:
+        """Table of tiles of type typ (backward breadth-first search)."""
+        mp = self.map
+        stride = self.stride
+        costs = bytearray([self.UNKNOWN])*(stride*stride)
+        ends = [t.pos for t in mp.unpack(mp.dest) if t.type == typ] + [self.gone]
+        leaves = []
+        for a in ends:
+            for b in ends:
+                if a != b or a == self.gone:
+                    costs[a*stride + b] = 0
+                    leaves.append((a, b))
+        predecessors = self.predecessors()
+        cost = 0
+        while leaves and cost < self.UNKNOWN - 1:
+            cost += 1
+            newleaves = []
+            for before in predecessors:
+                for a, b in leaves:
+                    for olda in before[a]:
+                        for oldb in before[b]:
+                            i = olda*stride + oldb
+                            if costs[i] == self.UNKNOWN and (olda != oldb or olda == self.gone):
+                                costs[i] = cost
+                                newleaves.append((olda, oldb))
+            leaves = newleaves
+        if leaves:  # capped, the remaining pairs need more moves
+            costs = costs.replace(bytes([self.UNKNOWN]), bytes([self.UNKNOWN - 1]))
+        return bytes(costs)
+
+    def lower_bound(self, tiles: bytes) -> int:
+        """Admissible lower bound of the number of moves from tiles to the target (see IntMap.lower_bound())."""
+        bound = self.map.lower_bound(tiles)
+        if not self.tables or bound >= self.map.UNREACHABLE:
+            return bound
+        codes = self.map.codes(tiles)
+        codepos = self.map.codepos
+        ntypes = self.map.NTYPES
+        stride = self.stride
+        for typ, table in self.tables.items():
+            positions = [codepos[c] for c in codes if c % ntypes == typ]
+            if len(positions) == 1:
+                positions.append(self.gone)
+            for i, a in enumerate(positions):
+                for b in positions[i+1:]:
+                    cost = table[a*stride + b]
+                    if cost > bound:
+                        if cost == self.UNKNOWN:
+                            return self.map.UNREACHABLE
+                        bound = cost
+        return bound
@@ -0,0 +1,86 @@
+from array import array
+import numpy as np
+from map import IntMap
+from frontier import VectorMap
+
+
+class PathReplay:
+    """Replays many paths on a map at once, e.g. to verify stored solutions after the map changed.
+
+    The paths are merged into a prefix tree, which is stored per level as the parent index and
+    direction of each node (like the tree of the solver, see IndexedNode), so a prefix shared by
+    several paths is only moved once. The tree is replayed level by level, with NumPy if vectorized
+    (see VectorMap), one direction at a time.
+    """
+    def __init__(self, mp: IntMap, vectorized: bool = False):
+        self.map = mp
+        self.vectorized = vectorized
+
+    def replay(self, paths: list[list[int]]) -> list[int or None]:
+        """Return for each path the number of steps after which the target is reached first
+        (0 if the start is solved already), or None if it is never reached.
+        """
+        levels, ends = self.prefixtree(paths)
+        replay = self.replay_vectorized if self.vectorized else self.replay_python
+        solvedat = replay(levels)
+        return [solvedat[length][node] for length, node in ends]
+
+    @staticmethod
+    def prefixtree(paths: list[list[int]]) -> tuple:
+        """Merge paths into a prefix tree.
+
+        ## Returns
+        tuple (levels, ends):
+        - levels: list of (parent indices, directions) of the nodes of each level below the root.
+        - ends: (level, index) of the last node of each path.
+        """
+        levels = []  # type: list[tuple[array, array]]
+        children = []  # type: list[dict]  # per level: (parent index, direction): index
+        ends = []
+        for path in paths:
+            node = 0
+            for depth, dir in enumerate(path):
+                if depth == len(levels):
+                    levels.append((array('I'), array('B')))
+                    children.append({})
+                child = children[depth].get((node, dir))
+                if child is None:
+                    child = children[depth][(node, dir)] = len(levels[depth][0])
+                    levels[depth][0].append(node)
+                    levels[depth][1].append(dir)
+                node = child
+            ends.append((len(path), node))
+        return levels, ends
+
+    def replay_python(self, levels: list[tuple]) -> list[list]:
+        """Move the nodes of the prefix tree.
+
+        ## Returns
+        for each level, the step at which the path to each node reached the target first (or None).
+        """
+        states = [self.map.start]
+        solvedat = [[0 if self.map.solved(self.map.start) else None]]
+        for depth, (parents, dirs) in enumerate(levels, start=1):
+            states = [self.map.move(states[parent], dir) for parent, dir in zip(parents, dirs)]
+            before = solvedat[-1]
+            solvedat.append([before[parent] if before[parent] is not None else (depth if self.map.solved(tiles) else None)
+                             for parent, tiles in zip(parents, states)])
+        return solvedat
+
+    def replay_vectorized(self, levels: list[tuple]) -> list[list]:
+        """Same as replay_python(), with whole levels moved at once."""
+        vmap = VectorMap(self.map)
+        rows = vmap.rows([self.map.start])
+        solvedat = [np.where(vmap.solved(rows), 0, -1)]  # -1: not reached
+        for depth, (parents, dirs) in enumerate(levels, start=1):
+            parents = np.asarray(parents, dtype=np.intp)
+            dirs = np.asarray(dirs, dtype=np.uint8)
+            newrows = np.empty((len(parents), vmap.width), dtype=rows.dtype)
+            for dir in range(4):
+                chosen = dirs == dir
+                if chosen.any():
+                    newrows[chosen] = vmap.move(rows[parents[chosen]], dir)
+            before = solvedat[-1][parents]
+            solvedat.append(np.where(before >= 0, before, np.where(vmap.solved(newrows), depth, -1)))
+            rows = newrows
+        return [[step if step >= 0 else None for step in level.tolist()] for level in solvedat]
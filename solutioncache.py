@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+from map import IntMap
+
+
+class SolutionCache:
+    """Results of earlier solves on disk, so solving the same map again returns at once or starts from the known bounds.
+
+    Each map has a file <hash>.json in the directory, where hash is the SHA-256 of the parsed map (see key()),
+    so the same map gives the same hash, no matter how its file is laid out. The file holds:
+    - 'path': an optimal path (arrows), or None.
+    - 'deadend': number of steps after which no moves are possible anymore (no solution exists), or None.
+    - 'lower': number of steps up to which no solution exists (proven by an exhausted search).
+    - 'upper': the shortest known path (arrows, not proven optimal), or None.
+    When the files exceed maxsize bytes, the least recently used ones are removed
+    (by modification time, which is updated on each hit).
+    """
+    VERSION = 1
+
+    def __init__(self, directory: str, maxsize: int = 2**26):
+        self.directory = directory
+        self.maxsize = maxsize  # bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, mp: IntMap) -> str:
+        """Hash of the blocks, start and target of the map, and of its key mode (fingerprints might hide solutions)."""
+        content = [self.VERSION, mp.keymode, mp.width, mp.height, sorted(mp.obstacles), sorted(mp.destroyers),
+                   list(mp.codes(mp.start)), list(mp.codes(mp.dest))]
+        return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+    def path(self, mp: IntMap) -> str:
+        return os.path.join(self.directory, self.key(mp) + ".json")
+
+    def get(self, mp: IntMap) -> dict or None:
+        """Return the entry of the map (see SolutionCache), or None if it is unknown."""
+        path = self.path(mp)
+        try:
+            with open(path, encoding='utf-8') as file:
+                entry = json.load(file)
+            os.utime(path)  # recently used
+        except (OSError, ValueError):  # unknown, damaged or just evicted
+            return None
+        return entry
+
+    def update(self, mp: IntMap, path: str = None, deadend: int = None, lower: int = 0, upper: str = None) -> None:
+        """Merge new knowledge about the map into its entry (same fields as the entry), then evict old entries."""
+        entry = self.get(mp) or {'path': None, 'deadend': None, 'lower': 0, 'upper': None}
+        if path is not None:
+            entry['path'] = path
+        if deadend is not None:
+            entry['deadend'] = deadend
+        entry['lower'] = max(entry['lower'], lower)
+        if upper is not None and (entry['upper'] is None or len(upper) < len(entry['upper'])):
+            entry['upper'] = upper
+        filename = self.path(mp)
+        temporary = f"{filename}.{os.getpid()}.tmp"  # other processes might store the same map
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(entry, file, ensure_ascii=False)
+        os.replace(temporary, filename)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used entries until all fit into maxsize."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:  # removed by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.maxsize:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
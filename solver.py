@@ -1,98 +1,804 @@
-from map import Map, IntMap, TileList, Tile
-from node import Node, NodeWithDestroyerTileSupport
+import heapq
+from array import array
+import queue
+import tempfile
+import threading
+import time
+import numpy as np
+from map import IntMap
+from node import Node, IndexedNode, StateList
+from frontier import VectorMap
+from bitboard import BitMap
+from parallel import ShardedSearch, ForgetfulPool, SharedBound
+from external import ExternalSearch
+from transposition import TranspositionTable
+from checkpoint import Checkpoint
+from memory import rss, peak_rss
+from telemetry import Telemetry
+from replay import PathReplay
+from pattern import PatternDatabase
+from solutioncache import SolutionCache
 
 
 class Tree:
     """Represents the game moves-tree.
     Saved are just the leaves (Node objects) from where one can iterate from above.
-    Additionally, the "seen" set contains all seen tile constellations.
+    Additionally, the "seen" set contains the keys of all seen tile constellations.
     """
     def __init__(self, leaves: set[Node], seen: set = None):
         self.leaves = leaves  # type: set[Node]
-        self.seen = seen  # type: set[frozenset]
+        self.seen = seen  # type: set  # keys, see IntMap.key()
         if self.seen is None:
             self.seen = set()
         self.height = 0  # level of the leaves
 
+    def add(self, key) -> bool:
+        """Add key of a constellation to the seen set. Returns False if it has been seen already."""
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        return True
+
+
+class Result:
+    """Outcome of Solver.solve().
+
+    status is one of:
+    - 'solved': path has been found (optimal).
+    - 'no solution': no solution has been found within steps steps.
+    - 'dead end': no moves are possible anymore after steps steps (no solution exists).
+    - 'unsolvable': the map can't be solved for reason (see IntMap.find_deadlock()).
+    - 'interrupted': the search has been stopped by a deadline or cancelled, path is the best one
+      found so far (or None), which is not proven to be optimal.
+    """
+    STATUSES = ['solved', 'no solution', 'dead end', 'unsolvable', 'interrupted']
+
+    def __init__(self, status: str, path: list[int] = None, steps: int = None, reason: str = None):
+        self.status = status
+        self.path = path  # type: list[int] or None
+        self.steps = steps  # type: int or None  # path length, searched path length or dead end step
+        self.reason = reason  # type: str or None
+        self.arrows = ""  # path as direction arrows
+        self.expanded = 0  # number of constellations whose moves have been computed
+        self.time = 0.0  # seconds
+        self.peak_rss = 0  # bytes
+
+    @property
+    def optimal(self) -> bool:
+        """True, if path is proven to be a shortest one."""
+        return self.status == 'solved'
+
+    def __str__(self) -> str:
+        if self.status == 'solved':
+            return f"Found optimal path in {self.steps} steps:\n{self.arrows}"
+        if self.status == 'interrupted' and self.path is not None:
+            return f"Interrupted, best path so far (not proven optimal) in {self.steps} steps:\n{self.arrows}"
+        if self.status == 'interrupted':
+            return "Interrupted before finding a solution."
+        if self.status == 'dead end':
+            return f"No moves possible anymore after {self.steps} steps."
+        if self.status == 'unsolvable':
+            return f"Map can't be solved: {self.reason}."
+        return f"Found no solution in {self.steps} steps."
+
+    def todict(self) -> dict:
+        """Return the result as dictionary (for JSON)."""
+        return {'status': self.status, 'steps': self.steps, 'path': self.arrows if self.path is not None else None,
+                'reason': self.reason, 'optimal': self.optimal, 'expanded': self.expanded, 'time': round(self.time, 3), 'peak_rss': self.peak_rss}
+
+
+class Interrupted(Exception):
+    """Raised by Solver.check_stop(), when the deadline has passed or the search is cancelled."""
+
 
 class Solver():
-    def __init__(self, filename: str, treesize: int, forgetfulsize: int):
-        self.map = IntMap(filename)
+    ENGINES = ['python', 'numpy', 'external', 'bitboard']
+    ALGORITHMS = ['bfs', 'bidirectional', 'astar', 'idastar']
+    CHUNKSIZE = 2**16  # number of states to move at once in vectorized engine
+    QUEUED = 4  # number of queued leaves per worker in parallel forgetful iteration
+    POLLTIME = 0.1  # seconds between checks for the deadline while waiting for workers
+
+    def __init__(self, filename: str, treesize: int, forgetfulsize: int, keymode: str = 'zobrist', engine: str = 'python',
+                 workers: int = 1, algorithm: str = 'bfs', memorybudget: int = None, scratchdir: str = None,
+                 tablesize: int = 2**20, eviction: str = 'deepest', symmetry: bool = True,
+                 checkpoint: str = None, checkpointevery: int = 1000, resume: bool = False,
+                 telemetry: Telemetry = None, mapcache: str = None, patterns: bool = True,
+                 solutioncache: SolutionCache = None):
+        self.filename = filename
+        self.mapcache = mapcache  # type: str or None  # directory of compiled maps (see MapCache)
+        self.engine = engine
+        # paths of bidirectional and A* search are joined by keys, which must not be mirror images
+        self.symmetry = symmetry and algorithm not in ['bidirectional', 'astar']
+        self.map = IntMap(filename, keymode=keymode, symmetry=self.symmetry, cachedir=mapcache)
         self.treesize = treesize
         self.forgetfulsize = forgetfulsize
+        self.workers = workers
+        self.algorithm = algorithm
+        self.lower_bound = self.map.lower_bound  # admissible heuristic of astar and idastar
+        if patterns and algorithm in ['astar', 'idastar']:
+            start = time.perf_counter()
+            database = PatternDatabase(self.map, cachedir=mapcache)
+            if database.tables:
+                self.lower_bound = database.lower_bound
+                print(f"Pattern database of {len(database.tables)} tile type(s) ready ({time.perf_counter() - start:.2f} s).")
+        self.memorybudget = memorybudget  # type: int or None  # bytes
+        self.scratchdir = scratchdir  # type: str or None  # parent directory of tree levels on disk
+        self.tablesize = tablesize  # maximum number of entries in the transposition table of forgetful iteration
+        self.eviction = eviction  # see TranspositionTable
+        self.expanded = 0  # number of constellations whose moves have been computed
+        self.checkpoint = None  # type: Checkpoint or None
+        if checkpoint is not None:
+            settings = {'map': Checkpoint.hashfile(filename), 'treesize': treesize, 'forgetfulsize': forgetfulsize,
+                        'keymode': keymode, 'engine': engine, 'workers': workers, 'symmetry': self.symmetry,
+                        'leaforder': 'lower bound'}
+            self.checkpoint = Checkpoint(checkpoint, settings)
+        self.checkpointevery = checkpointevery  # number of leaves of forgetful iteration between checkpoints
+        self.resume = resume
+        self.telemetry = telemetry  # type: Telemetry or None
+        self.deadline = None  # type: float or None  # time.time() to stop at
+        self.cancel = []  # type: list  # tokens like threading.Event, the search stops when one is set
+        self.best = False  # best path found so far (by forgetful iteration)
+        self.solutioncache = solutioncache  # type: SolutionCache or None
+        self.proven = 0  # path length up to which no solution exists (exhausted tree levels or IDA* thresholds)
+        self.known = False  # shortest path known from the solution cache (not proven optimal)
+        self.knownlower = 0  # path length up to which no solution exists according to the solution cache
 
-        self.newnode = Node
-        if self.map.has_destroyer_tiles():
-            self.newnode = NodeWithDestroyerTileSupport
+        self.buildtree = self.buildtree_python
+        if engine == 'numpy':
+            self.buildtree = self.buildtree_vectorized
+        elif engine == 'external':
+            self.buildtree = self.buildtree_external
+        elif engine == 'bitboard':
+            self.buildtree = self.buildtree_bitboard
+        elif workers > 1:
+            self.buildtree = self.buildtree_parallel
+
+    def solve(self, deadline: float = None, cancel=None) -> Result:
+        """Search for solution. Prints progress only, the outcome is returned (see Result).
+
+        ## Parameters:
+        deadline: (float) time.time() to stop at, then the best path found so far is returned.
+            It is checked while searching only: compiling the map and building the pattern database
+            happen in Solver() before (and workers of -j compile the map again when they start).
+        cancel: token like threading.Event (or list of them), stops the search like the deadline when it is set.
+        """
+        starttime = time.perf_counter()
+        self.expanded = 0
+        self.best = False
+        self.proven = 0
+        self.deadline = deadline
+        self.cancel = cancel if type(cancel) == list else [token for token in [cancel] if token is not None]
+        if self.telemetry is not None:
+            self.telemetry.start_profiler()
+        try:
+            result = self.search()
+        except Interrupted:
+            print("           ", end="\r")  # delete progress counter
+            print("Interrupted.")
+            result = Result('interrupted', self.best or None, len(self.best) if self.best else None)
+        finally:
+            if self.telemetry is not None:
+                self.telemetry.stop_profiler()
+        result.expanded = self.expanded
+        result.time = time.perf_counter() - starttime
+        result.peak_rss = peak_rss()
+        if result.path is not None:
+            result.arrows = self.map.strpath(result.path)
+        if self.solutioncache is not None and result.status != 'unsolvable':
+            self.solutioncache.update(self.map, path=result.arrows if result.status == 'solved' else None,
+                                      deadend=result.steps if result.status == 'dead end' else None,
+                                      lower=result.steps if result.status == 'no solution' else self.proven,
+                                      upper=result.arrows or None)
+        return result
+
+    def recall(self, maxlength: int) -> Result or None:
+        """Look the map up in the solution cache (if any).
 
-    def solve(self) -> list or False:
-        """Search for solution.
-        
         ## Returns
-        - path (list) if solution found.
-        - False, if no solution found.
+        the result, if it is known well enough for a search up to maxlength steps, else None.
+        The known bounds are kept in self.known and self.knownlower for the search then.
         """
-        root = self.newnode(self.map.start)
-        print(f"Building tree with {self.treesize} levels... ")
-        treeresult = self.buildtree(set([root]))
-        print("Done.")
-        if type(treeresult) == list:
-            path = treeresult
-            print(f"Found optimal path in {len(path)} steps:")
-            print(self.map.strpath(path))
-            return path
-        if type(treeresult) == int:
-            dead_end_step = treeresult
-            print(f"No moves possible anymore after {dead_end_step} steps.")
-            return False
-        if type(treeresult) == Tree:
-            tree = treeresult
-            print(f"Starting forgetful iteration with additional path-length of {self.forgetfulsize}... ")
-            result = self.forgetful_iteration(tree, self.forgetfulsize)
+        self.known = False
+        self.knownlower = 0
+        entry = self.solutioncache.get(self.map) if self.solutioncache is not None else None
+        if entry is None:
+            return None
+        if entry['path'] is not None:
+            path = [self.map.DIRECTIONS.index(a) for a in entry['path']]
+            print("Optimal path known from solution cache.")
+            return Result('solved', path, len(path))
+        if entry['deadend'] is not None:
+            print("Dead end known from solution cache.")
+            return Result('dead end', steps=entry['deadend'])
+        if entry['lower'] >= maxlength:
+            print(f"Known from solution cache: no solution in {entry['lower']} steps.")
+            return Result('no solution', steps=entry['lower'])
+        self.knownlower = self.proven = entry['lower']
+        if entry['upper'] is not None:
+            self.known = [self.map.DIRECTIONS.index(a) for a in entry['upper']]
+        print(f"Known from solution cache: no solution in {entry['lower']} steps"
+              + (f", a path in {len(self.known)} steps." if self.known else "."))
+        return None
+
+    def stream(self, deadline: float = None, cancel=None):
+        """Solve in a background thread and yield events as they happen (see Telemetry, which is
+        replaced meanwhile): progress ('level' and 'leaf'), each improved path ('solution', not
+        proven optimal yet), and finally {'event': 'result', 'result': Result}.
+        Same parameters as solve() (the deadline doesn't cover the setup in Solver() either).
+        Leaving the loop early cancels the search.
+        """
+        events = queue.Queue()
+        telemetry = self.telemetry
+        self.telemetry = Telemetry(callback=events.put)
+        stop = threading.Event()  # set when the caller stops iterating
+        failure = []  # exception of the thread
+
+        def run():
+            try:
+                result = self.solve(deadline, [token for token in [cancel, stop] if token is not None])
+                events.put({'event': 'result', 'result': result})
+            except BaseException as exception:  # like SystemExit of a map error
+                failure.append(exception)
+                events.put(None)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            while True:
+                event = events.get()
+                if event is None:
+                    raise failure[0]
+                yield event
+                if event['event'] == 'result':
+                    return
+        finally:
+            stop.set()
+            thread.join()
+            self.telemetry = telemetry
+
+    def check_stop(self) -> None:
+        """Raise Interrupted, if the deadline has passed or the search is cancelled."""
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise Interrupted()
+        for token in self.cancel:
+            if token.is_set():
+                raise Interrupted()
+
+    def search(self) -> Result:
+        """Search for solution with the configured algorithm (see solve())."""
+        if self.map.unsolvable:
+            return Result('unsolvable', reason=self.map.unsolvable)
+        known = self.recall(self.treesize + self.forgetfulsize)
+        if known is not None:
+            return known
+        if self.algorithm == 'bidirectional' and self.map.has_destroyers():
+            print("Bidirectional search does not support destroyers, using breadth-first search.")
+        elif self.algorithm in ['bidirectional', 'astar', 'idastar']:
+            maxlength = self.treesize + self.forgetfulsize
+            search = {'bidirectional': self.bidirectional, 'astar': self.astar, 'idastar': self.idastar}[self.algorithm]
+            if self.known and len(self.known) <= maxlength:  # only search for shorter paths
+                maxlength = len(self.known) - 1
+                self.best = self.known
+            print(f"Searching ({self.algorithm}) with up to {maxlength} steps... ")
+            result = search(maxlength)
             print("Done.")
-            if result is False:
-                print(f"Found no solution in {self.treesize+self.forgetfulsize} steps.")
-            elif type(result) == list:
-                path = result
-                print(f"Found optimal path in {len(path)} steps:")
-                print(self.map.strpath(path))
-            return result
+            if type(result) == list:
+                return Result('solved', result, len(result))
+            if self.best:  # there is no shorter path than the known one
+                return Result('solved', self.best, len(self.best))
+            if type(result) == int:
+                return Result('dead end', steps=result)
+            return Result('no solution', steps=maxlength)
+
+        root = Node(self.map.start, self.map.key(self.map.start))
+        resumed = self.checkpoint.load_tree(self.map.keymode) if (self.resume and self.checkpoint) else None
+        if resumed is not None and resumed[3]:  # complete tree
+            levels, frontier, seen, _ = resumed
+            tree = Tree(set(IndexedNode(tiles, key, levels, i) for i, (tiles, key) in enumerate(frontier)), seen)
+            tree.height = len(levels)
+            print(f"Resumed tree with {tree.height} levels.")
+        else:
+            print(f"Building tree with {self.treesize} levels... ")
+            if resumed is not None and self.buildtree == self.buildtree_python:
+                print(f"  Resuming at level {len(resumed[0])}.")
+                treeresult = self.buildtree_python(set([root]), resumed)
+            else:
+                treeresult = self.buildtree(set([root]))
+            print("Done.")
+            if type(treeresult) == list:
+                return Result('solved', treeresult, len(treeresult))
+            if type(treeresult) == int:
+                return Result('dead end', steps=treeresult)
+            tree = treeresult
+            if self.checkpoint is not None and (self.buildtree != self.buildtree_python or tree.height == 0):
+                # other engines save the tree once it is complete (and so does python, if it has no levels),
+                # so the progress of forgetful iteration can be saved along with it
+                leaves = sorted(tree.leaves, key=lambda node: getattr(node, 'index', 0))
+                frontier = StateList(self.map.keymode)
+                for node in leaves:
+                    frontier.append(node.tiles, node.key)
+                self.checkpoint.save_tree(leaves[0].levels if tree.height else [], frontier, tree.seen, complete=True)
+        print(f"Starting forgetful iteration with additional path-length of {self.forgetfulsize}... ")
+        path = self.forgetful_iteration(tree, self.forgetfulsize)
+        print("Done.")
+        if path is False:
+            return Result('no solution', steps=tree.height+self.forgetfulsize)
+        return Result('solved', path, len(path))
 
-    def buildtree(self, leaves: set[Node]) -> list or Tree or int:
+    def buildtree_python(self, leaves: set[Node], resumed: tuple = None) -> list or Tree or int:
         """Breadth-first iteration through tree.
+        Each completed level is saved to self.checkpoint (if set).
 
         ## Parameters:
         tiles: current position of each game tile.
         leaves: nodes to walk through
         it_left: number of iterations left.
+        resumed: (tuple) tree loaded from a checkpoint to continue with (see Checkpoint.load_tree()).
 
         ## Returns
         - path: (list) if optimal solution found inside tree.
         - tree: (Tree) if no solution found in tree.
         - steps: (int) if no moves possible anymore.
         """
-        tree = Tree(leaves)
-        for level in range(self.treesize):
-            newleaves = set()  # leaves of new level
-            for node in tree.leaves:
-                moves = self.map.moves(node.tiles)  # type: list[TileList.hashabletype]
-                for dir_i, newtiles in enumerate(moves):
+        tree = Tree(leaves, set(node.key for node in leaves))
+        levels = []  # type: list[tuple[array, array]]  # (parent indices, edges) per level, see IndexedNode
+        frontier = StateList(self.map.keymode)  # states of the last level
+        for node in leaves:
+            frontier.append(node.tiles, node.key)
+        if resumed is not None:
+            levels, frontier, tree.seen, _ = resumed
+            tree.height = len(levels)
+        saved = tree.height  # levels in self.checkpoint
+        self.baseline = rss()
+        for level in range(tree.height, self.treesize):
+            levelstart = time.perf_counter()
+            self.expanded += len(frontier)
+            newfrontier = StateList(self.map.keymode)
+            parents = array('I')
+            edges = array('B')
+            pruned = duplicates = 0
+            for i, (tiles, key) in enumerate(frontier):
+                if i & 4095 == 0:
+                    self.check_stop()
+                moves = self.map.keyed_moves(tiles, key)  # type: list[tuple[bytes, object]]
+                for dir_i, (newtiles, newkey) in enumerate(moves):
                     if self.map.node_has_no_future(newtiles):
+                        pruned += 1
                         continue
-                    newleaf = self.newnode(newtiles, node, dir_i)
-                    if newleaf.get_tiles() == self.map.dest:
-                        return newleaf.getrootpath()
-                    if newleaf.tiles not in tree.seen:
-                        newleaves.add(newleaf)
-                        tree.seen.add(newleaf.tiles)
-            if len(newleaves) == 0:
+                    if self.map.solved(newtiles):
+                        return IndexedNode(None, None, levels, i).getrootpath() + [dir_i]
+                    if tree.add(newkey):
+                        newfrontier.append(newtiles, newkey)
+                        parents.append(i)
+                        edges.append(dir_i)
+                    else:
+                        duplicates += 1
+            self.level_event(level+1, len(frontier), len(newfrontier), duplicates, pruned, levelstart)
+            if len(newfrontier) == 0:
                 return level
-            tree.leaves = newleaves
+            growth = len(newfrontier) / len(frontier)
+            levels.append((parents, edges))
+            frontier = newfrontier
             tree.height = level+1
             print(f"{tree.height}/{self.treesize}", end="\r")
+            fits = self.nextlevel_fits(rss(), len(tree.seen), len(frontier), growth)
+            if self.checkpoint is not None:
+                newseen = tree.seen
+                if saved:  # only the keys of the new level were added
+                    newseen = frontier.keys if frontier.keys is not None else [self.map.key(tiles) for tiles, _ in frontier]
+                self.checkpoint.save_tree(levels, frontier, newseen, complete=not fits or tree.height == self.treesize,
+                                          saved=saved)
+                saved = tree.height
+            if not fits:
+                break
+        print("           ", end="\r")  # delete progress counter
+        if levels:
+            tree.leaves = set(IndexedNode(tiles, key, levels, i) for i, (tiles, key) in enumerate(frontier))
+        return tree
+
+    def level_event(self, level: int, nleaves: int, nnew: int, duplicates: int or None, pruned: int or None,
+                    levelstart: float, **fields) -> None:
+        """Emit telemetry of a completed tree level (if self.telemetry is set).
+
+        ## Parameters:
+        level: (int) number of the new level.
+        nleaves: (int) number of expanded leaves of the level before.
+        nnew: (int) number of new constellations.
+        duplicates: (int) number of dropped, already seen constellations (None if unknown).
+        pruned: (int) number of constellations dropped by node_has_no_future() (None if unknown).
+        levelstart: (float) time.perf_counter() when expanding started.
+        """
+        self.proven = max(self.proven, level)  # the level has no solution
+        if self.telemetry is None:
+            return
+        seconds = time.perf_counter() - levelstart
+        rate = None  # share of already seen constellations
+        if duplicates is not None:
+            rate = duplicates / (duplicates + nnew) if duplicates + nnew else 0.0
+        self.telemetry.emit('level', engine=self.engine, level=level, frontier=nleaves, new=nnew,
+                            duplicates=duplicates, duplicate_rate=rate, pruned=pruned,
+                            states_per_s=nleaves / seconds if seconds > 0 else None, level_time=seconds, **fields)
+
+    def nextlevel_fits(self, used: int, nseen: int, nleaves: int, growth: float) -> bool:
+        """True, if another tree level probably fits into self.memorybudget (or if there is no budget).
+
+        The memory per seen constellation is measured by the growth of the resident set size
+        since self.baseline (set when building the tree starts), the number of new leaves
+        is projected with the growth of the last level.
+
+        ## Parameters:
+        used: (int) memory used now (bytes).
+        nseen: (int) number of seen constellations.
+        nleaves: (int) number of leaves of the last level.
+        growth: (float) ratio of leaves of the last level and the level before.
+        """
+        if self.memorybudget is None:
+            return True
+        perstate = max(used - self.baseline, 0) / nseen
+        projected = used + perstate * nleaves * growth
+        if projected <= self.memorybudget:
+            return True
+        print(f"Next level would need about {projected / 2**20:.0f} MiB, stopping tree at this level.")
+        return False
+
+    def buildtree_vectorized(self, leaves: set[Node]) -> list or Tree or int:
+        """Breadth-first iteration through tree, moving whole tree levels at once with NumPy.
+        Same parameters and return values as buildtree_python().
+
+        Each level is stored as arrays of parent indices and edges only (see IndexedNode),
+        duplicates are detected with sorted arrays of exact keys.
+        """
+        vmap = VectorMap(self.map)
+        frontier = vmap.rows([node.tiles for node in leaves])
+        seen = np.unique(vmap.canonical_keys(frontier))  # sorted keys of all levels
+        levels = []  # type: list[tuple[np.ndarray, np.ndarray]]
+        self.baseline = rss()
+        for level in range(self.treesize):
+            levelstart = time.perf_counter()
+            self.expanded += len(frontier)
+            parts = []  # new (keys, rows, parents, edges) of each chunk
+            generated = pruned = 0
+            for offset in range(0, len(frontier), self.CHUNKSIZE):
+                self.check_stop()
+                chunk = frontier[offset:offset+self.CHUNKSIZE]
+                moves = vmap.moves(chunk)  # type: np.ndarray  # (4, states, tiles)
+                rows = moves.reshape(-1, vmap.width)
+                parents = np.tile(np.arange(offset, offset+len(chunk), dtype=np.uint32), 4)
+                edges = np.repeat(np.arange(4, dtype=np.uint8), len(chunk))
+
+                alive = ~vmap.node_has_no_future(rows)
+                rows, parents, edges = rows[alive], parents[alive], edges[alive]
+                pruned += len(alive) - len(rows)
+                generated += len(rows)
+                solved = np.flatnonzero(vmap.solved(rows))
+                if len(solved) > 0:
+                    i = solved[0]
+                    return IndexedNode(None, None, levels + [(parents, edges)], i).getrootpath()
+
+                keys, first = np.unique(vmap.canonical_keys(rows), return_index=True)
+                new = ~vmap.contains(seen, keys)
+                first = first[new]
+                parts.append((keys[new], rows[first], parents[first], edges[first]))
+
+            keys = np.concatenate([p[0] for p in parts]) if parts else np.empty(0, vmap.keyview)
+            keys, first = np.unique(keys, return_index=True)  # duplicates between chunks
+            self.level_event(level+1, len(frontier), len(keys), generated - len(keys), pruned, levelstart)
+            if len(keys) == 0:
+                return level
+            growth = len(keys) / len(frontier)
+            frontier = np.concatenate([p[1] for p in parts])[first]
+            levels.append((np.concatenate([p[2] for p in parts])[first],
+                           np.concatenate([p[3] for p in parts])[first]))
+            seen = np.concatenate([seen, keys])
+            seen.sort(kind='stable')  # merges the two sorted runs
+            print(f"{level+1}/{self.treesize}", end="\r")
+            if not self.nextlevel_fits(rss(), len(seen), len(frontier), growth):
+                break
         print("           ", end="\r")  # delete progress counter
+
+        states = vmap.states(frontier)
+        tree = Tree(set(IndexedNode(tiles, self.map.key(tiles), levels, i) for i, tiles in enumerate(states)))
+        tree.seen = set(self.map.key(tiles) for tiles in vmap.states(vmap.unkeys(seen)))
+        tree.height = len(levels)
         return tree
 
+    def buildtree_bitboard(self, leaves: set[Node]) -> list or Tree or int:
+        """Breadth-first iteration through tree, moving all tiles of a type at once with bitboards (see BitMap).
+        Same parameters and return values as buildtree_python().
+
+        Duplicates are detected with the boards (or their canonical mirror image, see BitMap.key()).
+        """
+        bmap = BitMap(self.map)
+        frontier = [bmap.board(node.tiles) for node in leaves]
+        seen = set(bmap.key(board) for board in frontier)
+        levels = []  # type: list[tuple[array, array]]  # (parent indices, edges) per level, see IndexedNode
+        self.baseline = rss()
+        for level in range(self.treesize):
+            levelstart = time.perf_counter()
+            self.expanded += len(frontier)
+            newfrontier = []
+            parents = array('I')
+            edges = array('B')
+            pruned = duplicates = 0
+            for i, board in enumerate(frontier):
+                if i & 4095 == 0:
+                    self.check_stop()
+                for dir_i, newboard in enumerate(bmap.moves(board)):
+                    if bmap.node_has_no_future(newboard):
+                        pruned += 1
+                        continue
+                    if bmap.solved(newboard):
+                        return IndexedNode(None, None, levels, i).getrootpath() + [dir_i]
+                    newkey = bmap.key(newboard)
+                    if newkey in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(newkey)
+                    newfrontier.append(newboard)
+                    parents.append(i)
+                    edges.append(dir_i)
+            self.level_event(level+1, len(frontier), len(newfrontier), duplicates, pruned, levelstart)
+            if len(newfrontier) == 0:
+                return level
+            growth = len(newfrontier) / len(frontier)
+            levels.append((parents, edges))
+            frontier = newfrontier
+            print(f"{level+1}/{self.treesize}", end="\r")
+            if not self.nextlevel_fits(rss(), len(seen), len(frontier), growth):
+                break
+        print("           ", end="\r")  # delete progress counter
+
+        tree = Tree(leaves, set(self.map.key(bmap.pack(key)) for key in seen))
+        if levels:
+            states = [bmap.pack(board) for board in frontier]
+            tree.leaves = set(IndexedNode(tiles, self.map.key(tiles), levels, i) for i, tiles in enumerate(states))
+        tree.height = len(levels)
+        return tree
+
+    def buildtree_external(self, leaves: set[Node]) -> list or Tree or int:
+        """Breadth-first iteration through tree, which keeps all tree levels on disk (see ExternalSearch).
+        Same parameters and return values as buildtree_python().
+
+        Levels are stored in a temporary directory inside self.scratchdir, which is removed
+        when the solver is deleted. The returned tree has no seen set (it wouldn't fit into memory).
+        """
+        vmap = VectorMap(self.map)
+        self.scratch = tempfile.TemporaryDirectory(prefix="bitlocksolve-", dir=self.scratchdir)
+        search = ExternalSearch(vmap, self.scratch.name)
+        search.start(vmap.rows([node.tiles for node in leaves]))
+        nleaves = len(leaves)
+        for level in range(self.treesize):
+            self.check_stop()
+            levelstart = time.perf_counter()
+            self.expanded += nleaves
+            nnew, solution = search.expand(self.check_stop)
+            if solution is not None:
+                parent, edge = solution
+                return IndexedNode(None, None, search.levels(), parent).getrootpath() + [int(edge)]
+            self.level_event(level+1, nleaves, nnew, None, None, levelstart)
+            if nnew == 0:
+                return level
+            nleaves = nnew
+            print(f"{level+1}/{self.treesize}", end="\r")
+        print("           ", end="\r")  # delete progress counter
+
+        levels = search.levels()
+        tree = Tree(set())
+        for rows in search.leaves():
+            for tiles in vmap.states(rows):
+                tree.leaves.add(IndexedNode(tiles, self.map.key(tiles), levels, len(tree.leaves)))
+        tree.height = len(levels)
+        return tree
+
+    def buildtree_parallel(self, leaves: set[Node]) -> list or Tree or int:
+        """Breadth-first iteration through tree on self.workers processes.
+        Same parameters and return values as buildtree_python().
+
+        Each worker expands its share of a level and owns a slice of the seen set (see ShardedSearch).
+        Levels are synchronized, so a solution found in a level is still optimal.
+        """
+        search = ShardedSearch(self.filename, self.map.keymode, self.symmetry, self.workers, self.mapcache)
+        try:
+            search.start([(node.tiles, node.key) for node in leaves])
+            self.baseline = search.rss()
+            nseen = nleaves = len(leaves)
+            for level in range(self.treesize):
+                self.check_stop()
+                levelstart = time.perf_counter()
+                self.expanded += nleaves
+                nnew, solution, used = search.expand(self.check_stop)
+                if solution is not None:
+                    levels, _, _, offsets = search.gather()
+                    ref, edge = solution
+                    parent = IndexedNode(None, None, levels[:level], search.globalindex(offsets, level, ref))
+                    return parent.getrootpath() + [edge]
+                self.level_event(level+1, nleaves, nnew, None, None, levelstart, rss=used)
+                if nnew == 0:
+                    return level
+                growth = nnew / nleaves
+                nseen += nnew
+                nleaves = nnew
+                print(f"{level+1}/{self.treesize}", end="\r")
+                if not self.nextlevel_fits(used, nseen, nleaves, growth):
+                    break
+            print("           ", end="\r")  # delete progress counter
+            levels, leaves, seen, _ = search.gather()
+        finally:
+            search.close()
+        tree = Tree(set(IndexedNode(tiles, key, levels, i) for i, (tiles, key) in enumerate(leaves)), seen)
+        tree.height = len(levels)
+        return tree
+
+    def bidirectional(self, maxlength: int) -> list or False or int:
+        """Breadth-first iteration from start and backwards from target, until both meet.
+        The side with fewer leaves is expanded next. Only for maps without destroyers
+        (see IntMap.predecessors()).
+
+        ## Parameters:
+        maxlength: (int) Maximum path length.
+
+        ## Returns
+        - path (list) if optimal solution found.
+        - False if no solution found within maxlength steps.
+        - steps (int) if one side has no new constellations anymore (no solution exists).
+        """
+        start = self.map.start
+        dest = self.map.dest
+        if self.map.solved(start):
+            return []
+        if len(start) != len(dest):
+            return 0  # tiles can't vanish without destroyers
+        startkey = self.map.key(start)
+        destkey = self.map.key(dest)
+        forward = {startkey: None}  # type: dict  # key: (parent key, edge)
+        backward = {destkey: None}  # type: dict  # key: (child key, edge)
+        forwardleaves = [(start, startkey)]
+        backwardleaves = [(dest, destkey)]
+        for length in range(1, maxlength+1):
+            self.check_stop()
+            newleaves = []
+            if len(forwardleaves) <= len(backwardleaves):
+                self.expanded += len(forwardleaves)
+                for tiles, key in forwardleaves:
+                    for dir_i, (newtiles, newkey) in enumerate(self.map.keyed_moves(tiles, key)):
+                        if newkey in backward:
+                            return self.meetingpath(forward, backward, key, dir_i, newkey)
+                        if newkey not in forward:
+                            forward[newkey] = (key, dir_i)
+                            newleaves.append((newtiles, newkey))
+                forwardleaves = newleaves
+            else:
+                self.expanded += len(backwardleaves)
+                for tiles, key in backwardleaves:
+                    for dir_i in range(len(self.map.DIRECTIONS)):
+                        for newtiles in self.map.predecessors(tiles, dir_i):
+                            newkey = self.map.key(newtiles)
+                            if newkey in forward:
+                                return self.meetingpath(forward, backward, newkey, dir_i, key)
+                            if newkey not in backward:
+                                backward[newkey] = (key, dir_i)
+                                newleaves.append((newtiles, newkey))
+                backwardleaves = newleaves
+            if len(newleaves) == 0:
+                return length
+            print(f"{length}/{maxlength}", end="\r")
+        print("           ", end="\r")  # delete progress counter
+        return False
+
+    def meetingpath(self, forward: dict, backward: dict, key, edge: int, nextkey) -> list[int]:
+        """Join the paths of bidirectional(), where constellation key is turned into nextkey by edge."""
+        path = [edge]
+        while forward[key] is not None:
+            key, dir_i = forward[key]
+            path.insert(0, dir_i)
+        while backward[nextkey] is not None:
+            nextkey, dir_i = backward[nextkey]
+            path.append(dir_i)
+        return path
+
+    def astar(self, maxlength: int) -> list or False or int:
+        """A* search with the admissible lower bound of IntMap.lower_bound() (or PatternDatabase.lower_bound()).
+
+        ## Parameters:
+        maxlength: (int) Maximum path length.
+
+        ## Returns
+        - path (list) if optimal solution found.
+        - False if no solution found within maxlength steps.
+        - steps (int) if no moves are possible anymore after this many steps (no solution exists).
+        """
+        start = self.map.start
+        startkey = self.map.key(start)
+        bound = self.lower_bound(start)
+        if bound > maxlength:
+            return False if bound < self.map.UNREACHABLE else 0
+        parents = {startkey: None}  # type: dict  # key: (parent key, edge)
+        depths = {startkey: 0}  # type: dict  # key: shortest known path length
+        heap = [(bound, 0, 0, start, startkey)]  # (estimated length, -depth, counter, tiles, key)
+        counter = 1  # never compare tiles
+        cutoff = False  # nodes beyond maxlength have been dropped
+        maxdepth = 0
+        while heap:
+            _, depth, _, tiles, key = heapq.heappop(heap)
+            depth = -depth
+            if depth > depths[key]:
+                continue  # a shorter path has been found meanwhile
+            if self.map.solved(tiles):
+                path = []
+                while parents[key] is not None:
+                    key, dir_i = parents[key]
+                    path.insert(0, dir_i)
+                return path
+            maxdepth = max(maxdepth, depth)
+            self.expanded += 1
+            if self.expanded & 1023 == 0:
+                self.check_stop()
+            for dir_i, (newtiles, newkey) in enumerate(self.map.keyed_moves(tiles, key)):
+                if self.map.node_has_no_future(newtiles):
+                    continue
+                if depth+1 >= depths.get(newkey, maxlength+1):
+                    cutoff = cutoff or newkey not in depths
+                    continue
+                bound = self.lower_bound(newtiles)
+                if depth+1 + bound > maxlength:
+                    cutoff = cutoff or bound < self.map.UNREACHABLE
+                    continue
+                depths[newkey] = depth+1
+                parents[newkey] = (key, dir_i)
+                heapq.heappush(heap, (depth+1 + bound, -(depth+1), counter, newtiles, newkey))
+                counter += 1
+        return False if cutoff else maxdepth
+
+    def idastar(self, maxlength: int) -> list or False or int:
+        """Iterative deepening A* search with the admissible lower bound of IntMap.lower_bound() (or PatternDatabase.lower_bound()).
+        Needs memory only for the current path. Same parameters and return values as astar().
+        """
+        start = self.map.start
+        startkey = self.map.key(start)
+        threshold = max(self.lower_bound(start), self.knownlower + 1)
+        path = []
+        while threshold <= maxlength:
+            print(f"{threshold}/{maxlength}", end="\r")
+            result = self.idastar_iteration(start, startkey, threshold, path, set([startkey]))
+            if result is True:
+                print("           ", end="\r")  # delete progress counter
+                return path
+            if result >= self.map.UNREACHABLE:
+                return threshold  # nothing has been cut off
+            self.proven = max(self.proven, threshold)  # no solution up to threshold
+            threshold = result
+        print("           ", end="\r")  # delete progress counter
+        return False if threshold < self.map.UNREACHABLE else 0
+
+    def idastar_iteration(self, tiles: bytes, key, threshold: int, path: list[int], onpath: set) -> True or int:
+        """Depth-first iteration of idastar() below threshold, starting at tiles after path.
+
+        ## Returns
+        - True if a solution has been found, path is the solution then.
+        - the smallest estimated path length above threshold, otherwise.
+        """
+        estimate = len(path) + self.lower_bound(tiles)
+        if estimate > threshold:
+            return estimate
+        if self.map.solved(tiles):
+            return True
+        self.expanded += 1
+        if self.expanded & 1023 == 0:
+            self.check_stop()
+        minimum = self.map.UNREACHABLE
+        for dir_i, (newtiles, newkey) in enumerate(self.map.keyed_moves(tiles, key)):
+            if newkey in onpath or self.map.node_has_no_future(newtiles):
+                continue  # cycles (like blocked moves) can't be part of a shortest path
+            path.append(dir_i)
+            onpath.add(newkey)
+            result = self.idastar_iteration(newtiles, newkey, threshold, path, onpath)
+            if result is True:
+                return True
+            path.pop()
+            onpath.remove(newkey)
+            minimum = min(minimum, result)
+        return minimum
+
     def forgetful_iteration(self, tree, length) -> list or False:
         """Try all possibilities starting starting from tree.leaves, with given path-length.
         
@@ -104,54 +810,169 @@ class Solver():
         - path (list) if optimal path found.
         - False if no optimal path found.
         """
-        # sort nodes by distance to destination
+        # sort nodes by lower bound of their distance to the target (and position in tree, so the order is reproducible)
         nodes = list(tree.leaves)
         print(f"  Sorting {len(nodes)} leaves by distance to target... ", end="")
-        dest = TileList(self.map.dest)
-        distances = [TileList(node.tiles).dist(dest, self.map) for node in nodes]
-        nodes = [node for _, node in sorted(zip(distances, nodes), key=lambda pair: pair[0])]
+        keys = [(self.lower_bound(node.tiles), getattr(node, 'index', 0)) for node in nodes]
+        order = sorted(range(len(nodes)), key=keys.__getitem__)
+        nodes = [nodes[i] for i in order]
+        estimates = [keys[i][0] for i in order]  # type: list[int]  # lower bound of each leaf
         print("Done.")
 
         maxlength = length
         path = False  # optimal path
+        first = 0  # first leaf to search
+        progress = self.checkpoint.load_progress() if (self.resume and self.checkpoint) else None
+        if progress is not None:
+            first, maxlength, path = progress['leaf'], progress['maxlength'], progress['path']
+            self.best = path
+            print(f"  Resuming at leaf {first}.")
+        if self.known and len(self.known) - tree.height - 1 < maxlength and (path is False or len(self.known) < len(path)):
+            # only search for paths shorter than the known one
+            path = self.best = self.known
+            maxlength = len(path) - tree.height - 1
         numleaves = len(tree.leaves)
-        for i, node in enumerate(tree.leaves):
-            result = self.iterate_heightfirst(node, tree.height, maxlength, 0)
-            if type(result) == list:
-                path = result
+        table = TranspositionTable(self.tablesize, self.eviction)  # shared by all leaves (of a worker)
+        if self.workers > 1:
+            searched = self.search_leaves_parallel(nodes, estimates, first, tree, maxlength, table)
+        else:
+            searched = self.search_leaves(nodes, estimates, first, tree, maxlength, table)
+        done = set()  # searched leaves after the first unsearched one
+        skipped = 0
+        for i, result, expanded, hits, seconds in searched:
+            skipped += hits
+            if type(result) == list and (path is False or len(result) < len(path)):
+                path = self.best = result
                 print(f"  Found solution in {len(path)} (+{len(path) - tree.height}) steps:", self.map.strpath(path))
                 maxlength = len(path) - tree.height - 1  # adjust maximum step length
-            print(f"{i}/{numleaves}", end="\r")
+                if self.telemetry is not None:
+                    self.telemetry.emit('solution', path=path, arrows=self.map.strpath(path), steps=len(path),
+                                        optimal=False)
+            if self.telemetry is not None:
+                self.telemetry.emit('leaf', leaf=i, leaves=numleaves, expanded=expanded, skipped=hits,
+                                    maxlength=maxlength, solution=len(result) if type(result) == list else None,
+                                    leaf_time=seconds)
+            done.add(i)
+            while first in done:  # all leaves before first have been searched
+                done.remove(first)
+                first += 1
+                if self.checkpoint is not None and first % self.checkpointevery == 0:
+                    self.checkpoint.save_progress(first, maxlength, path)
+            print(f"{first}/{numleaves}", end="\r")
+            self.check_stop()
         print("           ", end="\r")  # delete progress counter
+        print(f"  Skipped {skipped} known constellations.")
         return path
+
+    def search_leaves(self, nodes: list[Node], estimates: list[int], first: int, tree: Tree, maxlength: int,
+                      table: TranspositionTable):
+        """Search nodes[first:] one after another (see forgetful_iteration()).
+        Leaves whose lower bound (estimates) exceeds the maximum length are not searched.
+
+        ## Yields
+        tuple (leaf index, result of iterate_heightfirst(), expanded constellations, skipped constellations, seconds)
+        """
+        for i in range(first, len(nodes)):
+            if estimates[i] > maxlength:
+                yield i, False, 0, 0, 0.0
+                continue
+            start = time.perf_counter()
+            expanded, hits = self.expanded, table.hits
+            result = self.iterate_heightfirst(nodes[i], tree.height, maxlength, 0, table, tree.seen)
+            if type(result) == list:
+                maxlength = len(result) - tree.height - 1
+            yield i, result, self.expanded - expanded, table.hits - hits, time.perf_counter() - start
+
+    def search_leaves_parallel(self, nodes: list[Node], estimates: list[int], first: int, tree: Tree, maxlength: int,
+                               table: TranspositionTable):
+        """Search nodes[first:] on self.workers processes (see ForgetfulPool).
+        Same parameters and yields as search_leaves(), in the order the leaves are finished.
+
+        Every worker has its own copy of table. Paths of equal length might be found in any order,
+        so the returned one might differ from sequential search (but not its length).
+        """
+        def search(tiles: bytes, key, bound: SharedBound) -> tuple:
+            """Search a leaf in a worker (a root node there, so the path is relative to the leaf)."""
+            self.deadline, self.cancel = None, []  # the main process stops the workers
+            start = time.perf_counter()
+            expanded, hits = self.expanded, table.hits
+            result = self.iterate_heightfirst(Node(tiles, key), 0, bound.value, 0, table, tree.seen, bound)
+            return result, self.expanded - expanded, table.hits - hits, time.perf_counter() - start
+
+        pool = ForgetfulPool(search, self.workers, maxlength)
+        try:
+            queued = first
+            while queued < len(nodes) or pool.pending:
+                while queued < len(nodes) and pool.pending < self.QUEUED * self.workers:
+                    if estimates[queued] > pool.bound.value:  # can't lead to a shorter path
+                        yield queued, False, 0, 0, 0.0
+                    else:
+                        pool.submit(queued, nodes[queued].tiles, nodes[queued].key)
+                    queued += 1
+                finished = pool.result(timeout=self.POLLTIME)
+                if finished is None:
+                    self.check_stop()
+                    continue
+                i, result, expanded, hits, seconds = finished
+                self.expanded += expanded  # counted in the worker
+                if type(result) == list:
+                    result = nodes[i].getrootpath() + result
+                yield i, result, expanded, hits, seconds
+        finally:
+            pool.close()
     
-    def iterate_heightfirst(self, node, treeheight, maxlength, depth):
-        """Search for solution by height-first iteration, beginning at node.
+    def iterate_heightfirst(self, node, treeheight, maxlength, depth, table, seen, bound=None):
+        """Search for solution by height-first iteration (branch and bound), beginning at node.
+        Constellations which have already been searched at the same or a lower depth are skipped,
+        like constellations of the memorized tree (a shorter path to them is known), and moves which don't
+        change the constellation. The other moves are searched in order of their lower bound (see self.lower_bound),
+        as long as it doesn't exceed the maximum length, which is lowered by every found solution.
 
         ## Parameters:
         node: (Node) node object to start from.
         baseheight: (int) memorized tree height to start from.
         treeheight: (int) number of steps to try.
         depth: (int) current iteration depth.
+        table: (TranspositionTable) constellations searched so far (for all leaves).
+        seen: (set) keys of the memorized tree.
+        bound: (SharedBound) maximum step length shared with other processes (see ForgetfulPool), or None.
 
         ## Returns
         - False if no solution has been found,
         - path (list) if solution has been found.
         """
         path = False
+        if bound is not None:
+            maxlength = min(maxlength, bound.value)
         if (maxlength - depth) <= 0:
             return False
-        moves = self.map.moves(node.tiles)  # type: list[TileList.hashabletype]
-        for dir_i, newtiles in enumerate(moves):
-            if self.map.node_has_no_future(newtiles):
+        self.expanded += 1
+        if self.expanded & 1023 == 0:
+            self.check_stop()
+        moves = self.map.keyed_moves(node.tiles, node.key)  # type: list[tuple[bytes, object]]
+        children = []  # (lower bound, direction, tiles, key)
+        for dir_i, (newtiles, newkey) in enumerate(moves):
+            if newkey == node.key or self.map.node_has_no_future(newtiles):
+                continue
+            if self.map.solved(newtiles):
+                return Node(newtiles, newkey, node, dir_i).getrootpath()
+            if newkey in seen or table.searched(newkey, depth+1):
                 continue
-            newleaf = self.newnode(newtiles, node, dir_i)
-            if newleaf.get_tiles() == self.map.dest:
-                return newleaf.getrootpath()
-            result = self.iterate_heightfirst(newleaf, treeheight, maxlength, depth+1)
+            children.append((self.lower_bound(newtiles), dir_i, newtiles, newkey))
+        children.sort(key=lambda child: child[0])  # stable, ties keep the order of directions
+        for estimate, dir_i, newtiles, newkey in children:
+            if bound is not None:
+                maxlength = min(maxlength, bound.value)
+            if depth+1 + estimate > maxlength:
+                break  # neither this nor the following moves can lead to a shorter path
+            table.add(newkey, depth+1)
+            result = self.iterate_heightfirst(Node(newtiles, newkey, node, dir_i), treeheight, maxlength, depth+1,
+                                              table, seen, bound)
             if type(result) == list:  # found a solution
                 path = result
                 maxlength = len(path) - treeheight - 1  # adjust maximum step length
+                if bound is not None:
+                    bound.tighten(maxlength)
         return path
 
     def walkthrough(self, path: list or str):
@@ -171,9 +992,40 @@ class Solver():
         print(self.map.str(tiles))
         for dir in path:
             print(self.map.DIRECTIONS[dir])
-            tiles = TileList(sorted(tiles))
-            if dir in [1, 3]:
-                tiles = tiles[::-1]
             tiles = self.map.move(tiles, dir)
             print(self.map.str(tiles))
             input()
+
+    def verify(self, filename: str) -> int:
+        """Replay the arrow paths in a file (one per line, blank lines and lines starting with # are skipped)
+        and print for each path whether and after how many steps it solves the map. Uses NumPy with the numpy engine.
+
+        ## Returns
+        number of paths which do not solve the map.
+        """
+        paths = []
+        with open(filename, encoding='utf-8') as file:
+            for line in file:
+                arrows = line.strip()
+                if not arrows or arrows.startswith('#'):
+                    continue
+                try:
+                    paths.append([self.map.DIRECTIONS.index(a) for a in arrows])
+                except ValueError:
+                    print(f"ERROR: invalid path {arrows!r} in {filename}, use arrow symbols (like in output)")
+                    exit(10)
+
+        start = time.perf_counter()
+        steps = PathReplay(self.map, vectorized=self.engine == 'numpy').replay(paths)
+        seconds = time.perf_counter() - start
+        for path, solvedat in zip(paths, steps):
+            arrows = self.map.strpath(path)
+            if solvedat is None:
+                print(f"{arrows}: not solved after {len(path)} steps")
+            elif solvedat < len(path):
+                print(f"{arrows}: solved in {solvedat} steps (followed by {len(path) - solvedat} more)")
+            else:
+                print(f"{arrows}: solved in {solvedat} steps")
+        unsolved = steps.count(None)
+        print(f"{len(paths) - unsolved} of {len(paths)} paths solve the map ({seconds:.3f} s).")
+        return unsolved
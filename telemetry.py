@@ -0,0 +1,106 @@
+import json
+import signal
+import time
+from collections import Counter
+from memory import rss
+
+
+class Telemetry:
+    """Events of a search, written as JSON lines to a file and/or passed to a callback.
+
+    Every event is a dict with 'event' (its kind), 'time' (seconds since the telemetry was created),
+    'rss' (bytes) and the fields of its kind:
+    - 'level': a completed tree level (see Solver.level_event()).
+    - 'leaf': a searched leaf of forgetful iteration (see Solver.forgetful_iteration()).
+    - 'solution': a shorter path found by forgetful iteration (not proven optimal before it is finished).
+    - 'profile': samples of the profiler, if any (see Profiler.summary()).
+    """
+    def __init__(self, filename: str = None, callback=None, profiler=None):
+        self.file = open(filename, 'w') if filename is not None else None
+        self.callback = callback  # function(event: dict)
+        self.profiler = profiler  # type: Profiler or None
+        self.start = time.perf_counter()
+
+    def emit(self, event: str, **fields) -> None:
+        entry = {'event': event, 'time': round(time.perf_counter() - self.start, 6), 'rss': rss()}
+        entry.update(fields)
+        if self.file is not None:
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+        if self.callback is not None:
+            self.callback(entry)
+
+    def start_profiler(self) -> None:
+        if self.profiler is not None:
+            self.profiler.start()
+
+    def stop_profiler(self) -> None:
+        """Stop the profiler and emit its samples."""
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.emit('profile', **self.profiler.summary())
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class Profiler:
+    """Sampling profiler: every interval seconds of CPU time, the running code is sampled (Unix only).
+
+    A sample belongs to the section of the innermost function on the stack which is listed in
+    SECTIONS (by qualified name), or to 'other'. The innermost source lines are counted as hotspots.
+    """
+    SECTIONS = {
+        # move generation
+        'IntMap.keyed_moves': 'moves', 'IntMap.moves': 'moves', 'IntMap.move': 'moves',
+        'VectorMap.moves': 'moves', 'BitMap.moves': 'moves', 'BitMap.move': 'moves', 'BitMap.movelayer': 'moves',
+        # duplicate detection
+        'Tree.add': 'dedup', 'IntMap.key': 'dedup', 'IntMap.canonical_key': 'dedup',
+        'VectorMap.keys': 'dedup', 'VectorMap.canonical_keys': 'dedup', 'VectorMap.contains': 'dedup',
+        'ExternalSearch.merge': 'dedup', 'TranspositionTable.searched': 'dedup', 'TranspositionTable.add': 'dedup',
+        'BitMap.key': 'dedup',
+        'unique': 'dedup',  # np.unique
+        # pruning
+        'IntMap.compile_checks.<locals>.<lambda>': 'pruning',  # IntMap.node_has_no_future (and solved)
+        'IntMap.enough_tiles': 'pruning', 'IntMap.enough_region_tiles': 'pruning', 'IntMap.misordered_corridor': 'pruning',
+        'BitMap.__init__.<locals>.<lambda>': 'pruning',  # BitMap.node_has_no_future
+        'BitMap.enough_tiles': 'pruning', 'BitMap.enough_region_tiles': 'pruning',
+        'VectorMap.node_has_no_future': 'pruning', 'IntMap.lower_bound': 'pruning', 'PatternDatabase.lower_bound': 'pruning',
+    }
+    HOTSPOTS = 10  # number of hotspots in summary()
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.sections = Counter()  # type: Counter  # section: number of samples
+        self.lines = Counter()  # type: Counter  # (file, line, function): number of samples
+
+    def start(self) -> None:
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self) -> None:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def sample(self, signum, frame) -> None:
+        code = frame.f_code
+        self.lines[(code.co_filename, frame.f_lineno, code.co_qualname)] += 1
+        while frame is not None:
+            section = self.SECTIONS.get(frame.f_code.co_qualname)
+            if section is not None:
+                self.sections[section] += 1
+                return
+            frame = frame.f_back
+        self.sections['other'] += 1
+
+    def summary(self) -> dict:
+        """Number of samples in total and per section, and the most sampled source lines."""
+        return {'samples': sum(self.sections.values()), 'interval': self.interval, 'sections': dict(self.sections),
+                'hotspots': [[f"{filename}:{line} {function}", n]
+                             for (filename, line, function), n in self.lines.most_common(self.HOTSPOTS)]}
+
+    def __str__(self) -> str:
+        total = sum(self.sections.values()) or 1
+        return "Profile: " + ", ".join(f"{section} {n / total:.0%}" for section, n in self.sections.most_common())
@@ -0,0 +1,58 @@
+from collections import OrderedDict
+
+
+class TranspositionTable:
+    """Bounded table of constellations already searched by depth-first iteration, with the
+    shallowest depth they have been searched at. A constellation needs no further search at the
+    same or a larger depth, as long as the maximum path length does not grow.
+
+    When the table is full, an entry is evicted:
+    - 'deepest': one of the deepest entries (their subtrees are the smallest ones).
+    - 'lru': the least recently used entry.
+    """
+    EVICTIONS = ['deepest', 'lru']
+
+    def __init__(self, size: int, eviction: str = 'deepest'):
+        self.size = size  # maximum number of entries
+        self.eviction = eviction
+        self.entries = OrderedDict()  # type: OrderedDict  # key: depth, least recently used first
+        self.bydepth = []  # type: list[dict]  # keys (as dict keys, in insertion order) per depth, for 'deepest'
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def searched(self, key, depth: int) -> bool:
+        """True, if constellation key has already been searched at depth or a shallower one."""
+        known = self.entries.get(key)
+        if known is None or known > depth:
+            return False
+        if self.eviction == 'lru':
+            self.entries.move_to_end(key)
+        self.hits += 1
+        return True
+
+    def add(self, key, depth: int) -> None:
+        """Record that constellation key is searched at depth (shallower than before)."""
+        if self.size <= 0:
+            return
+        known = self.entries.pop(key, None)
+        if known is not None:
+            del self.bydepth[known][key]
+        elif len(self.entries) >= self.size:
+            self.evict()
+        self.entries[key] = depth
+        while len(self.bydepth) <= depth:
+            self.bydepth.append({})
+        self.bydepth[depth][key] = None
+
+    def evict(self) -> None:
+        if self.eviction == 'lru':
+            key, depth = self.entries.popitem(last=False)
+            del self.bydepth[depth][key]
+            return
+        while not self.bydepth[-1]:
+            self.bydepth.pop()
+        key = next(iter(self.bydepth[-1]))
+        del self.bydepth[-1][key]
+        del self.entries[key]